@@ -0,0 +1,45 @@
+from django.db import transaction
+from django.utils import timezone
+from orders.models import DeliveryCost, Order, OrderItem, OrderState
+from orders.totals import set_totals
+from products.stock import reserve_stock
+from .totals import with_prices
+
+class OutOfStock(Exception):
+    def __init__(self, items):
+        super().__init__(items)
+        self.items = items
+
+def create_order(cart):
+    # Creates the pending order of the cart, reserves its stock and empties the cart in one
+    # transaction, with a fixed number of queries whatever the number of items. When the stock
+    # does not cover the items, raises OutOfStock with the short ones and nothing is stored
+    with transaction.atomic():
+        items = list(with_prices(cart.items.filter(quantity__gt=0)).order_by('pk'))
+
+        order = Order(
+            client=cart.client,
+            session_id=cart.session_id,
+            created_at=timezone.now(),
+            state=OrderState.PENDING,
+            delivery_cost=DeliveryCost.objects.first().delivery_cost
+        )
+        set_totals(order, sum(i.total_price for i in items), sum(i.quantity for i in items), len(items), Order.tax_percentage)
+        order.save()
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product_id=item.product_id,
+                size_id=item.size_id,
+                colour_id=item.colour_id,
+                quantity=item.quantity,
+                unit_price=item.unit_price
+            )
+            for item in items
+        ])
+        short_items = reserve_stock(order, items)
+        if short_items:
+            raise OutOfStock(short_items)
+
+        cart.items.all().delete()
+    return order
@@ -0,0 +1,87 @@
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from products.models import ProductStock
+from django.utils import timezone
+from products.stock import get_stock_version, with_available_stock
+from .models import CartItem, MAX_ITEM_QUANTITY
+
+STOCK_CHECK_CACHE_TIMEOUT = 60 * 60
+
+# Stock of the row minus its active reservations, as products.stock.with_available_stock
+AVAILABLE_SQL = '''MAX({s}.stock - COALESCE((
+    SELECT SUM(r.quantity) FROM products_stockreservation r
+    WHERE r.stock_id = {s}.id AND r.expires_at > %(now)s
+), 0), 0)'''
+
+# Inserts the item or adds to its quantity in one statement. Both the new and the accumulated
+# quantity are clamped to the available stock of the product, size and colour (and to the item
+# maximum), so concurrent adds from the same cart can neither lose updates nor exceed the stock
+UPSERT_ITEM_SQL = f'''
+    INSERT INTO cart_cartitem (cart_id, product_id, size_id, colour_id, quantity)
+    SELECT %(cart)s, s.product_id, s.size_id, s.colour_id, MIN(%(quantity)s, {AVAILABLE_SQL.format(s='s')}, %(max)s)
+    FROM products_productstock s
+        INNER JOIN products_product p ON p.id = s.product_id
+    WHERE s.product_id = %(product)s AND s.size_id = %(size)s AND s.colour_id = %(colour)s
+        AND {AVAILABLE_SQL.format(s='s')} > 0 AND p.is_deleted = 0
+    ON CONFLICT (cart_id, product_id, size_id, colour_id) DO UPDATE SET quantity = MIN(
+        cart_cartitem.quantity + %(quantity)s,
+        (
+            SELECT {AVAILABLE_SQL.format(s='t')} FROM products_productstock t
+            WHERE t.product_id = excluded.product_id AND t.size_id = excluded.size_id AND t.colour_id = excluded.colour_id
+        ),
+        %(max)s
+    )
+    RETURNING id, quantity
+'''
+
+def add_item(cart, product_id, size_id, colour_id, quantity):
+    # Returns (item id, resulting quantity), or (None, 0) when there is no stock to add
+    params = {
+        'cart': cart.pk,
+        'product': product_id,
+        'size': size_id,
+        'colour': colour_id,
+        'quantity': quantity,
+        'max': MAX_ITEM_QUANTITY,
+        'now': connection.ops.adapt_datetimefield_value(timezone.now()),
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(UPSERT_ITEM_SQL, params)
+        row = cursor.fetchone()
+    return row if row != None else (None, 0)
+
+def check_items_stock(cart, force=False):
+    # Clamps every item to its available stock with a single UPDATE. It is skipped while the
+    # stock has not changed since the last check of this cart, unless the cart itself changed
+    checked_key = f'cart_stock_checked:{cart.pk}'
+    stock_version = get_stock_version()
+
+    if not force and cache.get(checked_key) == stock_version:
+        return cart
+
+    available = Subquery(
+        with_available_stock(ProductStock.objects.filter(
+            product=OuterRef('product'),
+            size=OuterRef('size'),
+            colour=OuterRef('colour')
+        )).values('available')[:1]
+    )
+    cart.items.filter(quantity__gt=Coalesce(available, 0)).update(quantity=Coalesce(available, 0))
+
+    cache.set(checked_key, stock_version, STOCK_CHECK_CACHE_TIMEOUT)
+    return cart
+
+def update_items(cart, quantities, deleted):
+    # Applies {item id: quantity} and the deleted item ids in one transaction
+    with transaction.atomic():
+        cart.items.filter(pk__in=deleted).delete()
+
+        items = cart.items.in_bulk([pk for pk in quantities if pk not in deleted])
+        for item in items.values():
+            item.quantity = quantities[item.pk]
+        CartItem.objects.bulk_update(items.values(), ['quantity'])
+
+        check_items_stock(cart, force=True)
+    return cart
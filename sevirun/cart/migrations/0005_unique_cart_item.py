@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:54
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def merge_duplicate_items(apps, schema_editor):
+    # Items of the same product, size and colour in a cart become one with the summed quantity
+    CartItem = apps.get_model('cart', 'CartItem')
+    duplicates = CartItem.objects.values('cart', 'product', 'size', 'colour')\
+        .annotate(count=Count('id'), quantity=Sum('quantity'))\
+        .filter(count__gt=1)
+
+    for d in duplicates:
+        items = CartItem.objects.filter(cart=d['cart'], product=d['product'], size=d['size'], colour=d['colour']).order_by('id')
+        first = items.first()
+        items.exclude(pk=first.pk).delete()
+        CartItem.objects.filter(pk=first.pk).update(quantity=min(d['quantity'], 99))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0004_cart_session_id_alter_cart_client_and_more'),
+        ('products', '0022_productcard'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_items, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('cart', 'product', 'size', 'colour'), name='unique_cart_item'),
+        ),
+    ]
@@ -5,6 +5,8 @@ from django.core.validators import MaxValueValidator, MinValueValidator, RegexVa
 
 # Create your models here.
 
+MAX_ITEM_QUANTITY = 99
+
 class Cart(models.Model):
     client = models.ForeignKey(AppUser, on_delete=models.CASCADE, null=True, blank=True)
     session_id = models.CharField(max_length=255, unique=True, null=True, blank=True)
@@ -21,12 +23,33 @@ class Cart(models.Model):
         
     @property
     def temp_subtotal(self):
-        allItems = self.items.all()
-        temp_price = 0
-        for item in allItems:
-            item_price = item.product.price_on_sale if item.product.price_on_sale else item.product.price
-            temp_price += item.quantity * item_price
-        return temp_price
+        return self.get_totals().subtotal
+
+    # Same interface as cart.session.SessionCart, the storage of the anonymous carts
+    def get_totals(self):
+        from .totals import get_cart_totals
+        return get_cart_totals(self)
+
+    def add_item(self, product_id, size_id, colour_id, quantity):
+        from .items import add_item
+        return add_item(self, product_id, size_id, colour_id, quantity)
+
+    def update_items(self, quantities, deleted):
+        from .items import update_items
+        return update_items(self, quantities, deleted)
+
+    def check_stock(self, force=False):
+        from .items import check_items_stock
+        return check_items_stock(self, force)
+
+    def is_empty(self):
+        return not self.items.exists()
+
+    def persist(self):
+        return self
+
+    def clear(self):
+        self.items.all().delete()
 
     def __str__(self):
         return f'''
@@ -41,7 +64,12 @@ class CartItem(models.Model):
     colour = models.ForeignKey(ProductColour, on_delete=models.DO_NOTHING, null=False)
     product = models.ForeignKey(Product, on_delete=models.DO_NOTHING, null=False)
     size = models.ForeignKey(ProductSize, on_delete = models.DO_NOTHING, null = False)
-    quantity = models.PositiveIntegerField(default=1, validators=[MinValueValidator(1), MaxValueValidator(99)], null=False)
+    quantity = models.PositiveIntegerField(default=1, validators=[MinValueValidator(1), MaxValueValidator(MAX_ITEM_QUANTITY)], null=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'product', 'size', 'colour'], name='unique_cart_item')
+        ]
 
     @property
     def temp_price(self):
@@ -0,0 +1,138 @@
+import uuid
+from decimal import Decimal
+from django.db import transaction
+from products.models import ProductStock
+from products.stock import with_available_stock
+from .models import Cart, CartItem, MAX_ITEM_QUANTITY
+from .totals import CartTotals
+
+# Anonymous carts live in the session payload, so browsing never writes a Cart row (nor a
+# session until something is added). The Cart row is only created along with the order
+SESSION_CART_KEY = 'cart'
+
+def empty_cart_data():
+    return {'items': [], 'next_id': 1}
+
+class SessionCart:
+    pk = None
+    client = None
+
+    def __init__(self, session):
+        self.session = session
+        self.data = session.get(SESSION_CART_KEY)
+
+        if self.data == None:
+            self.data = empty_cart_data()
+            if 'cart_session_id' in session:
+                self.load_database_cart()
+
+    @property
+    def session_id(self):
+        return self.session.get('cart_session_id')
+
+    def load_database_cart(self):
+        # Carts of this session stored in the database before (or by a previous order)
+        items = CartItem.objects.filter(cart__session_id=self.session_id)\
+            .values_list('pk', 'product_id', 'size_id', 'colour_id', 'quantity')
+
+        for pk, product_id, size_id, colour_id, quantity in items:
+            self.data['items'].append({'id': pk, 'product': product_id, 'size': size_id, 'colour': colour_id, 'quantity': quantity})
+            self.data['next_id'] = max(self.data['next_id'], pk + 1)
+        self.save()
+
+    def save(self):
+        self.session[SESSION_CART_KEY] = self.data
+        self.session.modified = True
+
+    def find_entry(self, product_id, size_id, colour_id):
+        return next((e for e in self.data['items'] if (e['product'], e['size'], e['colour']) == (product_id, size_id, colour_id)), None)
+
+    def get_stocks(self):
+        # Stock rows of the items with their product, size and colour, in one query
+        entries = self.data['items']
+        if not entries:
+            return {}
+
+        stocks = with_available_stock(ProductStock.objects.select_related('product', 'size', 'colour').filter(
+            product__in={e['product'] for e in entries},
+            size__in={e['size'] for e in entries},
+            colour__in={e['colour'] for e in entries},
+        ))
+        return {(s.product_id, s.size_id, s.colour_id): s for s in stocks}
+
+    def get_totals(self):
+        # Clamps the items to their stock (dropping the ones whose stock row is gone) and builds
+        # unsaved CartItems with the same unit_price and total_price as cart.totals
+        stocks = self.get_stocks()
+        entries, items, subtotal = [], [], Decimal('0')
+
+        for entry in self.data['items']:
+            stock = stocks.get((entry['product'], entry['size'], entry['colour']))
+            if stock == None:
+                continue
+            entry = dict(entry, quantity=min(entry['quantity'], stock.available))
+            entries.append(entry)
+
+            item = CartItem(id=entry['id'], product=stock.product, size=stock.size, colour=stock.colour, quantity=entry['quantity'])
+            product = stock.product
+            item.unit_price = product.price_on_sale if product.price_on_sale != None else product.price
+            item.total_price = item.unit_price * item.quantity
+            subtotal += item.total_price
+            items.append(item)
+
+        if entries != self.data['items']:
+            self.data['items'] = entries
+            self.save()
+        return CartTotals(items, subtotal)
+
+    def add_item(self, product_id, size_id, colour_id, quantity):
+        # Returns (item id, resulting quantity), or (None, 0) when there is no stock to add
+        stock = with_available_stock(ProductStock.objects.filter(
+            product_id=product_id, size_id=size_id, colour_id=colour_id, product__is_deleted=False
+        )).filter(available__gt=0).values_list('available', flat=True).first()
+        if stock == None:
+            return (None, 0)
+
+        entry = self.find_entry(product_id, size_id, colour_id)
+        if entry == None:
+            entry = {'id': self.data['next_id'], 'product': product_id, 'size': size_id, 'colour': colour_id, 'quantity': 0}
+            self.data['items'].append(entry)
+            self.data['next_id'] += 1
+
+        entry['quantity'] = min(entry['quantity'] + quantity, stock, MAX_ITEM_QUANTITY)
+        self.save()
+        return (entry['id'], entry['quantity'])
+
+    def update_items(self, quantities, deleted):
+        # The stock is applied by get_totals, which reads it anyway
+        self.data['items'] = [e for e in self.data['items'] if e['id'] not in deleted]
+        for entry in self.data['items']:
+            if entry['id'] in quantities:
+                entry['quantity'] = quantities[entry['id']]
+        self.save()
+        return self
+
+    def check_stock(self, force=False):
+        return self
+
+    def is_empty(self):
+        return not self.data['items']
+
+    def persist(self):
+        # Stores the cart in the database to create the order from it
+        if 'cart_session_id' not in self.session:
+            self.session['cart_session_id'] = str(uuid.uuid4())
+        items = [i for i in self.get_totals().items if i.quantity > 0]
+
+        with transaction.atomic():
+            cart, created = Cart.objects.get_or_create(session_id=self.session_id)
+            cart.items.all().delete()
+            CartItem.objects.bulk_create([
+                CartItem(cart=cart, product=i.product, size=i.size, colour=i.colour, quantity=i.quantity)
+                for i in items
+            ])
+        return cart
+
+    def clear(self):
+        self.data = empty_cart_data()
+        self.save()
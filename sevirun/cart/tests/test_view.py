@@ -12,6 +12,16 @@ import json
 from Crypto.Cipher import DES3
 from Crypto.Random import get_random_bytes
 from cart.test_fixtures import *
+from cart.totals import get_cart_totals
+from cart.session import SESSION_CART_KEY
+from cart.checkout import OutOfStock, create_order
+from products.stock import RESERVATION_TTL, decrement_stock, get_short_lines, release_expired_reservations, with_available_stock
+from django.core.management import call_command
+from django.utils import timezone
+import io
+from django.conf import settings
+from django.db import connection, IntegrityError
+from django.test.utils import CaptureQueriesContext
 from users.test_fixtures import *
 
 from unittest.mock import patch
@@ -576,9 +586,8 @@ def test_view_non_existing_unauth_cart(client):
 
     assert response.status_code == 200
     assert b'No hay productos' in response.content
-    assert currentCartCount == previousCartCount + 1
-    assert not Cart.objects.all()[0].client
-    assert Cart.objects.all()[0].session_id
+    assert currentCartCount == previousCartCount
+    assert settings.SESSION_COOKIE_NAME not in response.cookies
 
 @pytest.mark.django_db
 def test_view_non_existing_auth_cart(client, regular_user):
@@ -745,3 +754,350 @@ def test_create_order_from_empty_cart(client, regular_user):
 
     assert response.status_code == 302
     assert "cart" in response.url
+
+@pytest.mark.django_db
+def test_cart_view_clamps_items_to_stock(client, regular_user, auth_cart):
+    client.force_login(regular_user)
+    item = auth_cart.items.all()[0]
+    stock = ProductStock.objects.get(product=item.product, size=item.size, colour=item.colour)
+    item.quantity = 8
+    item.save()
+
+    client.get(reverse('cart'))
+    item.refresh_from_db()
+    assert item.quantity == 8
+
+    stock.stock = 3
+    stock.save()
+
+    client.get(reverse('cart'))
+    item.refresh_from_db()
+    assert item.quantity == 3
+
+@pytest.mark.django_db
+def test_cart_view_skips_stock_check_when_stock_did_not_change(client, regular_user, auth_cart):
+    client.force_login(regular_user)
+    client.get(reverse('cart'))
+
+    with CaptureQueriesContext(connection) as queries:
+        client.get(reverse('cart'))
+
+    assert not any(q['sql'].startswith('UPDATE "cart_cartitem"') for q in queries.captured_queries)
+
+@pytest.mark.django_db
+def test_cart_totals_in_one_query(regular_user, auth_cart, django_assert_num_queries):
+    item = auth_cart.items.all()[0]
+    item.quantity = 3
+    item.save()
+
+    with django_assert_num_queries(1):
+        totals = get_cart_totals(auth_cart)
+        assert totals.items[0].product.name == 'Test Product'
+
+    assert totals.items[0].unit_price == Decimal('6.99')
+    assert totals.items[0].total_price == Decimal('20.97')
+    assert totals.subtotal == Decimal('20.97')
+
+@pytest.mark.django_db
+def test_cart_totals_of_empty_cart(regular_user):
+    cart = Cart.objects.create(client=regular_user)
+
+    assert get_cart_totals(cart).subtotal == 0
+
+@pytest.mark.django_db
+def test_update_cart_applies_operations_in_one_request(client, regular_user, auth_cart, sample_product):
+    client.force_login(regular_user)
+    item = auth_cart.items.all()[0]
+    other = CartItem.objects.create(
+        cart=auth_cart,
+        product=sample_product,
+        size=ProductSize.objects.create(name='43'),
+        colour=item.colour,
+        quantity=1
+    )
+    ProductStock.objects.create(product=sample_product, size=other.size, colour=other.colour, stock=2)
+
+    operations = [
+        {'item': item.pk, 'quantity': 4},
+        {'item': other.pk, 'quantity': 5},
+    ]
+    response = client.post(reverse('update_cart'), json.dumps({'operations': operations}), content_type='application/json')
+    data = response.json()
+
+    assert response.status_code == 200
+    assert {i['id']: i['quantity'] for i in data['items']} == {item.pk: 4, other.pk: 2}
+    assert data['subtotal'] == pytest.approx(6 * 6.99)
+
+    operations = [{'item': other.pk, 'action': 'delete'}]
+    response = client.post(reverse('update_cart'), json.dumps({'operations': operations}), content_type='application/json')
+
+    assert [i['id'] for i in response.json()['items']] == [item.pk]
+
+@pytest.mark.django_db
+def test_update_cart_rejects_invalid_operations(client, regular_user, auth_cart):
+    client.force_login(regular_user)
+
+    response = client.post(reverse('update_cart'), json.dumps({'operations': [{'quantity': 2}]}), content_type='application/json')
+    assert response.status_code == 400
+
+    response = client.get(reverse('update_cart'))
+    assert response.status_code == 405
+
+@pytest.mark.django_db
+def test_add_product_to_cart_accumulates_up_to_stock(client, regular_user, auth_cart, sample_product):
+    client.force_login(regular_user)
+    stock = ProductStock.objects.get(product=sample_product)
+    url = reverse('add_to_cart', args=[sample_product.pk, stock.colour.pk, stock.size.pk, 6])
+
+    client.get(url)
+    response = client.get(url, headers={'X-Requested-With': 'XMLHttpRequest'})
+    data = response.json()
+
+    assert response.status_code == 200
+    assert data['added']
+    assert data['quantity'] == 10
+    assert auth_cart.items.count() == 1
+    assert auth_cart.items.get().quantity == 10
+
+    url = reverse('add_to_cart', args=[sample_product.pk, stock.colour.pk, stock.size.pk, 20])
+    data = client.get(url, headers={'X-Requested-With': 'XMLHttpRequest'}).json()
+
+    assert data['quantity'] == 10
+    assert data['message'] == "Ha intentado añadir más productos de los disponibles."
+
+@pytest.mark.django_db
+def test_add_product_to_cart_without_stock(client, regular_user, sample_product):
+    client.force_login(regular_user)
+    size = ProductSize.objects.create(name='39')
+    colour = ProductColour.objects.create(name='Blue')
+    ProductStock.objects.create(product=sample_product, size=size, colour=colour, stock=0)
+
+    url = reverse('add_to_cart', args=[sample_product.pk, colour.pk, size.pk, 1])
+    data = client.get(url, headers={'X-Requested-With': 'XMLHttpRequest'}).json()
+
+    assert not data['added']
+    assert CartItem.objects.count() == 0
+
+@pytest.mark.django_db
+def test_cart_item_is_unique_per_product_size_and_colour(auth_cart):
+    item = auth_cart.items.get()
+
+    with pytest.raises(IntegrityError):
+        CartItem.objects.create(cart=auth_cart, product=item.product, size=item.size, colour=item.colour, quantity=1)
+
+@pytest.mark.django_db
+def test_unauth_cart_is_kept_in_the_session(client, sample_product):
+    stock = ProductStock.objects.create(
+        product=sample_product,
+        size=ProductSize.objects.create(name='40'),
+        colour=ProductColour.objects.create(name='Green'),
+        stock=3
+    )
+    url = reverse('add_to_cart', args=[sample_product.pk, stock.colour.pk, stock.size.pk, 2])
+
+    client.get(url)
+    data = client.get(url, headers={'X-Requested-With': 'XMLHttpRequest'}).json()
+
+    assert data['quantity'] == 3
+    assert Cart.objects.count() == 0
+    assert len(client.session[SESSION_CART_KEY]['items']) == 1
+
+    response = client.get(reverse('cart'))
+    assert b'Test Product' in response.content
+    assert response.context['subtotal'] == Decimal('20.97')
+
+    item_id = response.context['items'][0].pk
+    operations = [{'item': item_id, 'quantity': 1}]
+    data = client.post(reverse('update_cart'), json.dumps({'operations': operations}), content_type='application/json').json()
+
+    assert data['items'] == [{'id': item_id, 'quantity': 1, 'item_total': 6.99}]
+    assert Cart.objects.count() == 0
+
+@pytest.mark.django_db
+def test_unauth_cart_is_clamped_to_stock(client, sample_product):
+    stock = ProductStock.objects.create(
+        product=sample_product,
+        size=ProductSize.objects.create(name='40'),
+        colour=ProductColour.objects.create(name='Green'),
+        stock=5
+    )
+    client.get(reverse('add_to_cart', args=[sample_product.pk, stock.colour.pk, stock.size.pk, 4]))
+
+    stock.stock = 2
+    stock.save()
+    response = client.get(reverse('cart'))
+
+    assert response.context['items'][0].quantity == 2
+    assert client.session[SESSION_CART_KEY]['items'][0]['quantity'] == 2
+
+@pytest.mark.django_db
+def test_create_order_from_unauth_cart(client, sample_product, delivery_cost):
+    stock = ProductStock.objects.create(
+        product=sample_product,
+        size=ProductSize.objects.create(name='40'),
+        colour=ProductColour.objects.create(name='Green'),
+        stock=5
+    )
+    client.get(reverse('add_to_cart', args=[sample_product.pk, stock.colour.pk, stock.size.pk, 2]))
+
+    response = client.get(reverse('create_order_from_cart'))
+    order = Order.objects.get()
+
+    assert response.url == reverse('order_info', args=[order.pk])
+    assert order.session_id == client.session['cart_session_id']
+    assert order.items.get().quantity == 2
+    assert Cart.objects.get().session_id == order.session_id
+    assert CartItem.objects.count() == 0
+    assert client.session[SESSION_CART_KEY]['items'] == []
+
+
+@pytest.mark.django_db
+def test_create_order_queries_do_not_grow_with_items(regular_user, auth_cart, sample_product, delivery_cost):
+    def count_queries(cart):
+        with CaptureQueriesContext(connection) as queries:
+            order = create_order(cart)
+        return order, len(queries.captured_queries)
+
+    order, single_item_queries = count_queries(auth_cart)
+    assert order.items.get().unit_price == Decimal('6.99')
+
+    colour = ProductColour.objects.create(name='Blue')
+    for name in ('38', '39', '40'):
+        size = ProductSize.objects.create(name=name)
+        ProductStock.objects.create(product=sample_product, size=size, colour=colour, stock=5)
+        CartItem.objects.create(cart=auth_cart, product=sample_product, size=size, colour=colour, quantity=2)
+
+    order, many_items_queries = count_queries(auth_cart)
+    assert order.items.count() == 3
+    assert many_items_queries == single_item_queries
+    assert not auth_cart.items.exists()
+
+@pytest.mark.django_db
+def test_pending_orders_reserve_their_stock(client, regular_user, auth_cart, delivery_cost):
+    item = auth_cart.items.get()
+    stock = ProductStock.objects.get(product=item.product, size=item.size, colour=item.colour)
+    item.quantity = 8
+    item.save()
+
+    order = create_order(auth_cart)
+    assert order.reservations.get().quantity == 8
+
+    # Only 2 of the 10 units are left for other customers
+    url = reverse('add_to_cart', args=[item.product.pk, item.colour.pk, item.size.pk, 5])
+    data = client.get(url, headers={'X-Requested-With': 'XMLHttpRequest'}).json()
+    assert data['quantity'] == 2
+
+    assert get_short_lines(order.items.all(), order=order) == []
+    assert decrement_stock(order.items.all(), order=order) == []
+    stock.refresh_from_db()
+    assert stock.stock == 2
+    assert not order.reservations.exists()
+
+@pytest.mark.django_db
+def test_orders_cannot_reserve_more_than_the_stock(client, regular_user, auth_cart, delivery_cost):
+    item = auth_cart.items.get()
+    item.quantity = 8
+    item.save()
+    create_order(auth_cart)
+
+    CartItem.objects.create(cart=auth_cart, product=item.product, size=item.size, colour=item.colour, quantity=5)
+    with pytest.raises(OutOfStock) as error:
+        create_order(auth_cart)
+
+    assert [i.quantity for i in error.value.items] == [5]
+    assert Order.objects.count() == 1
+    assert StockReservation.objects.get().quantity == 8
+    assert auth_cart.items.get().quantity == 5
+
+    client.force_login(regular_user)
+    response = client.get(reverse('create_order_from_cart'))
+    assert response.url == reverse('cart')
+    assert Order.objects.count() == 1
+
+@pytest.mark.django_db
+def test_expired_reservations_are_released(regular_user, auth_cart, delivery_cost):
+    item = auth_cart.items.get()
+    order = create_order(auth_cart)
+    stock = ProductStock.objects.get(product=item.product, size=item.size, colour=item.colour)
+
+    assert with_available_stock(ProductStock.objects.filter(pk=stock.pk)).get().available == 9
+    assert release_expired_reservations() == 0
+
+    call_command('release_stock_reservations', stdout=io.StringIO())
+    assert order.reservations.exists()
+
+    assert release_expired_reservations(timezone.now() + RESERVATION_TTL) == 1
+    assert with_available_stock(ProductStock.objects.filter(pk=stock.pk)).get().available == 10
+
+
+@pytest.mark.django_db
+def test_checkout_page(client, regular_user, auth_cart, delivery_cost):
+    client.force_login(regular_user)
+    response = client.get(reverse('checkout'))
+
+    assert response.status_code == 200
+    assert response.context['subtotal'] == Decimal('6.99')
+    assert response.context['total_price'] == Decimal('11.98')
+    assert b'Test Product' in response.content
+
+@pytest.mark.django_db
+def test_checkout_cash_on_delivery_in_one_post(client, regular_user, auth_cart, delivery_cost, mock_send_email):
+    client.force_login(regular_user)
+    item = auth_cart.items.get()
+    data = {'delivery_method': 'home', 'shipping_address': 'Calle Falsa 123', 'email': 'a@example.com', 'phone_number': '+34123456789', 'method': 'cod'}
+
+    response = client.post(reverse('checkout'), data)
+    order = Order.objects.get()
+
+    assert response.url == reverse('payment_ok', args=[order.pk])
+    assert order.state == 'PR'
+    assert order.payment_method == 'CA'
+    assert order.shipping_address == 'Calle Falsa 123'
+    assert order.delivery_cost == Decimal('4.99')
+    assert ProductStock.objects.get(product=item.product, size=item.size, colour=item.colour).stock == 9
+    assert not order.reservations.exists()
+    assert not auth_cart.items.exists()
+    mock_send_email.assert_called_once()
+
+@pytest.mark.django_db
+def test_checkout_cash_on_delivery_rolls_back_when_short(client, regular_user, auth_cart, delivery_cost, mock_send_email):
+    client.force_login(regular_user)
+    data = {'delivery_method': 'home', 'shipping_address': 'Calle Falsa 123', 'email': 'a@example.com', 'phone_number': '+34123456789', 'method': 'cod'}
+
+    # Another payment takes the units between the reservation and the decrement
+    with patch.object(cart_views, 'decrement_stock', side_effect=lambda lines, **kwargs: list(lines)):
+        response = client.post(reverse('checkout'), data)
+
+    assert response.url == reverse('cart')
+    assert not Order.objects.exists()
+    assert not StockReservation.objects.exists()
+    assert auth_cart.items.exists()
+    mock_send_email.assert_not_called()
+
+@pytest.mark.django_db
+def test_checkout_card_payment_renders_redsys_form(client, auth_cart, delivery_cost, regular_user):
+    client.force_login(regular_user)
+    data = {'delivery_method': 'store', 'email': 'a@example.com', 'phone_number': '+34123456789', 'method': 'card'}
+
+    with patch.dict('os.environ', _make_redsys_config()):
+        response = client.post(reverse('checkout'), data)
+    order = Order.objects.get()
+
+    assert response.status_code == 200
+    assert 'merchant_parameters' in response.context
+    assert order.state == 'PE'
+    assert order.payment_method == 'CC'
+    assert order.type == 'SP'
+    assert order.reservations.exists()
+
+@pytest.mark.django_db
+def test_checkout_rejects_invalid_data(client, regular_user, auth_cart, delivery_cost):
+    client.force_login(regular_user)
+    data = {'delivery_method': 'home', 'shipping_address': 'Calle Falsa 123', 'email': 'a@example.com', 'phone_number': 'abc', 'method': 'cod'}
+
+    response = client.post(reverse('checkout'), data)
+
+    assert response.status_code == 200
+    assert not Order.objects.exists()
+    assert auth_cart.items.exists()
+    assert "El formato del teléfono no es válido." in [str(m) for m in response.context['messages']]
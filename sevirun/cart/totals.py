@@ -0,0 +1,30 @@
+from decimal import Decimal
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum, Window
+from django.db.models.functions import Coalesce
+
+PRICE_FIELD = DecimalField(max_digits = 10, decimal_places = 2)
+
+class CartTotals:
+    def __init__(self, items, subtotal):
+        self.items = items
+        self.subtotal = subtotal
+
+    def get_item(self, item_id):
+        return next((i for i in self.items if i.pk == item_id), None)
+
+def with_prices(items):
+    # Annotates the effective unit price (price on sale falling back to price) and the line total
+    unit_price = Coalesce('product__price_on_sale', 'product__price', output_field=PRICE_FIELD)
+    return items.annotate(
+        unit_price=unit_price,
+        total_price=ExpressionWrapper(F('quantity') * unit_price, output_field=PRICE_FIELD)
+    )
+
+def get_cart_totals(cart):
+    # Items with their prices and the cart subtotal (a window SUM over the same rows) in one query
+    items = list(
+        with_prices(cart.items.select_related('product', 'size', 'colour'))
+            .annotate(subtotal=Window(Sum('total_price'), output_field=PRICE_FIELD))
+            .order_by('pk')
+    )
+    return CartTotals(items, items[0].subtotal if items else Decimal('0'))
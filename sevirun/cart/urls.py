@@ -3,6 +3,7 @@ from . import views
 
 urlpatterns = [
     path('', views.cart, name='cart'),
+    path('update/', views.update_cart, name='update_cart'),
     path("update-ajax/<int:item_id>/<str:action>/", 
         views.update_quantity_ajax, 
         name="update_quantity_ajax"),
@@ -10,6 +11,7 @@ urlpatterns = [
         views.add_product_to_cart, 
         name='add_to_cart'),
     path('create-order', views.create_order_from_cart, name='create_order_from_cart'),
+    path('checkout/', views.checkout, name='checkout'),
     path('pay/method/<int:order_id>/', views.payment_method, name='payment_method'),
     path('pay/start/<int:order_id>/', views.start_payment, name='start_payment'),
     path('pay/ok/<int:order_id>/', views.payment_success, name='payment_ok'),
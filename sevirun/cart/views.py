@@ -22,16 +22,53 @@ import time
 import random
 from decimal import Decimal
 from .models import *
-from products.models import ProductStock
-from django.http import JsonResponse
+from .session import SessionCart
+from .checkout import OutOfStock, create_order
+from django.db import transaction
+from products.stock import decrement_stock, get_short_lines
+from django.http import Http404, JsonResponse
 import uuid
-from django.utils import timezone
 from emails.emailService import send_order_confirmation_email
 
 from orders.models import DeliveryCost
+from orders.totals import compute_prices, round_price
 
 # Cart views
 
+PHONE_PATTERN = re.compile(r'^\+?[\d\s\-]{9,15}$')
+
+def parse_order_info(data):
+    # Returns the delivery and contact data of the form, or the error to show
+    info = {
+        "method": data.get("delivery_method"),
+        "address": data.get("shipping_address", "").strip(),
+        "email": data.get("email", "").strip(),
+        "phone_number": data.get("phone_number", "").strip(),
+    }
+    if info["phone_number"] == "" or info["email"] == "":
+        return None, "Debe completar todos los campos."
+    try:
+        validate_email(info["email"])
+    except ValidationError:
+        return None, "El formato del email no es válido."
+    if not PHONE_PATTERN.match(info["phone_number"]):
+        return None, "El formato del teléfono no es válido."
+    if info["method"] == "home" and info["address"] == "":
+        return None, "Debe completar todos los campos."
+    return info, None
+
+def apply_order_info(order, info, delivery_cost):
+    if info["method"] == "home":
+        order.type = OrderType.HOME_DELIVERY
+        order.shipping_address = info["address"]
+        order.delivery_cost = delivery_cost
+    else:
+        order.type = OrderType.SHOP
+        order.shipping_address = "En tienda"
+        order.delivery_cost = 0.0
+    order.phone_number = info["phone_number"]
+    order.client_email = info["email"]
+
 def order_info(request, order_id):
     order = get_object_or_404(Order, id=order_id)
 
@@ -42,174 +79,217 @@ def order_info(request, order_id):
             return redirect('home')
 
     if request.method == "POST":
-        method = request.POST.get("delivery_method")
-        address = request.POST.get("shipping_address").strip()
-        email = request.POST.get("email", "").strip()
-        phone_number = request.POST.get("phone_number", "").strip()
-        if phone_number == "" or email == "":
-            messages.error(request, "Debe completar todos los campos.")
+        info, error = parse_order_info(request.POST)
+        if error != None:
+            messages.error(request, error)
             return render(request, 'cart/order_info.html', {"order": order})
-        try:
-            validate_email(email)
-        except ValidationError:
-            messages.error(request, "El formato del email no es válido.")
-            return render(request, 'cart/order_info.html', {"order": order})
-        phone_pattern = re.compile(r'^\+?[\d\s\-]{9,15}$')
-        if not phone_pattern.match(phone_number):
-            messages.error(request, "El formato del teléfono no es válido.")
-            return render(request, 'cart/order_info.html', {"order": order})
-        if method == "home" and address == "":
-            messages.error(request, "Debe completar todos los campos.")
-            return render(request, 'cart/order_info.html', {"order": order})
-        if method == "home":
-            order.type = OrderType.HOME_DELIVERY
-            order.shipping_address = address
-            order.delivery_cost = DeliveryCost.objects.first().delivery_cost
-        else:
-            order.type = OrderType.SHOP
-            order.shipping_address = "En tienda"
-            order.delivery_cost = 0.0
-        order.phone_number = phone_number
-        order.client_email = email
+        apply_order_info(order, info, DeliveryCost.objects.first().delivery_cost)
         order.save()
         return redirect('payment_method', order_id=order.pk)
 
     return render(request, 'cart/order_info.html', {"order": order})
 
-
-def check_items_stock(cart):
-    cart.refresh_from_db()
-    items = cart.items.all()
-    for item in items:
-        stock = ProductStock.objects.filter(product=item.product, size=item.size, colour=item.colour)[0].stock
-        if item.quantity > stock:
-            item.quantity = stock
-            item.save()
-    cart.refresh_from_db()
-    return cart
-
 def get_or_create_cart(request):
+    # Anonymous carts are kept in the session, see cart.session
     if request.user.is_authenticated:
         cart, created = Cart.objects.get_or_create(client=request.user)
     else:
-        if 'cart_session_id' not in request.session:
-            request.session['cart_session_id'] = str(uuid.uuid4())
-        
-        session_id = request.session.get('cart_session_id')
-        cart, created = Cart.objects.get_or_create(session_id=session_id)
-    cart = check_items_stock(cart)
-    return cart
+        cart = SessionCart(request.session)
+    return cart.check_stock()
 
 def get_user_cart(request):
-    try: 
-        if request.user.is_authenticated:
-            return Cart.objects.get(client=request.user)
-        else:
-            if 'cart_session_id' in request.session:
-                return Cart.objects.get(session_id=request.session['cart_session_id'])
-    except:
-        return None
-    return None
+    if request.user.is_authenticated:
+        return Cart.objects.filter(client=request.user).first()
+    return SessionCart(request.session)
 
 def cart(request):
     if request.user.is_staff:
         messages.error(request, "Esta vista es sólo para clientes.")
         return redirect('home')
     cart = get_or_create_cart(request)
-    return render(request, "cart/view_cart.html", { 'cart': cart })
+    totals = cart.get_totals()
+    return render(request, "cart/view_cart.html", { 'cart': cart, 'items': totals.items, 'subtotal': totals.subtotal })
 
 def add_product_to_cart(request, product_id, colour_id, size_id, quantity):
     cart = get_or_create_cart(request)
 
-    product = get_object_or_404(Product, id=product_id)
-    colour = get_object_or_404(ProductColour, id=colour_id)
-    size = get_object_or_404(ProductSize, id=size_id)
-
     if not quantity:
         quantity = 1
 
-    cart_item, created = CartItem.objects.get_or_create(
-        cart=cart,
-        product=product,
-        colour=colour,
-        size=size,
-        defaults={'quantity': quantity}
-    )
-    if not created:
-        cart_item.quantity += quantity
-        cart_item.save()
-    
-    cart = check_items_stock(cart)
+    item_id, current_quantity = cart.add_item(product_id, size_id, colour_id, quantity)
 
-    currentQuantity = cart.items.get(id=cart_item.id).quantity
-    if currentQuantity < quantity:
-        messages.info(request, "Ha intentado añadir más productos de los disponibles.")
+    message = None
+    if item_id == None:
+        message = "No hay stock disponible de este producto en la talla y color seleccionados."
+    elif current_quantity < quantity:
+        message = "Ha intentado añadir más productos de los disponibles."
+
+    # The product page adds through AJAX and stays where it is
+    if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+        return JsonResponse({
+            "added": item_id != None,
+            "quantity": current_quantity,
+            "message": message,
+        })
 
+    if message != None:
+        messages.info(request, message)
     return redirect('cart') 
 
 def update_quantity_ajax(request, item_id, action):
     cart = get_user_cart(request)
-    item = get_object_or_404(CartItem, id=item_id, cart=cart)
-
-    if action == "increase":
-        item.quantity += 1
+    item = cart.get_totals().get_item(item_id) if cart != None else None
+    if item == None:
+        raise Http404
 
-    elif action == "decrease":
-        if item.quantity > 1:
-            item.quantity -= 1
-        
-    elif action == "delete":
-        cart = item.cart
-        item.delete()
+    if action == "delete":
+        cart.update_items({}, {item_id})
 
         return JsonResponse({
             "deleted": True,
-            "subtotal": float(cart.temp_subtotal),
+            "subtotal": float(cart.get_totals().subtotal),
         })
 
-    item.save()
-    cart.refresh_from_db()
-    cart = check_items_stock(cart)
-    item.refresh_from_db()
+    quantity = item.quantity
+    if action == "increase":
+        quantity = min(quantity + 1, MAX_ITEM_QUANTITY)
 
-    item_total = float(item.temp_price)
+    elif action == "decrease":
+        if quantity > 1:
+            quantity -= 1
 
-    cart_total = float(item.cart.temp_subtotal)
+    cart.update_items({item_id: quantity}, set())
+    totals = cart.get_totals()
+    item = totals.get_item(item_id)
 
     return JsonResponse({
         "deleted": False,
         "quantity": item.quantity,
-        "item_total": item_total,
-        "subtotal": cart_total,
+        "item_total": float(item.total_price),
+        "subtotal": float(totals.subtotal),
     })
 
-def create_order_from_cart(request):
+def get_cart_summary(totals):
+    return {
+        "items": [
+            {"id": i.pk, "quantity": i.quantity, "item_total": float(i.total_price)}
+            for i in totals.items
+        ],
+        "subtotal": float(totals.subtotal),
+    }
+
+def parse_cart_operations(body):
+    # [{"item": id, "quantity": n} | {"item": id, "action": "delete"}] -> ({id: quantity}, {ids})
+    operations = json.loads(body).get('operations')
+    if not isinstance(operations, list):
+        raise ValueError('operations')
+
+    quantities, deleted = {}, set()
+    for operation in operations:
+        item_id = int(operation['item'])
+        if operation.get('action') == 'delete':
+            deleted.add(item_id)
+        else:
+            quantities[item_id] = min(max(int(operation['quantity']), 1), MAX_ITEM_QUANTITY)
+    return quantities, deleted
+
+@require_http_methods(["POST"])
+def update_cart(request):
+    # Applies a batch of item operations in one transaction and returns the whole cart
     cart = get_user_cart(request)
-    cart_items = cart.items.all()
+    if cart == None:
+        return JsonResponse({"error": "No hay ningún carrito."}, status=404)
+
+    try:
+        quantities, deleted = parse_cart_operations(request.body)
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return JsonResponse({"error": "Operaciones no válidas."}, status=400)
+
+    cart.update_items(quantities, deleted)
+    return JsonResponse(get_cart_summary(cart.get_totals()))
 
-    if len(cart_items) == 0:
+def create_order_from_cart(request):
+    stored_cart = get_user_cart(request)
+
+    if stored_cart == None or stored_cart.is_empty():
         messages.error(request, "El carrito está vacío.")
         return redirect('cart')
     
     if request.user.is_staff:
         messages.error(request, "Esta vista es sólo para clientes.")
         return redirect('home')
-    
-    cart_client = cart.client if cart.client else None
-    cart_session_id = cart.session_id if cart.session_id else None
 
-    delivery_cost = DeliveryCost.objects.first().delivery_cost
-    
-    order = Order.objects.create(client=cart_client, session_id=cart_session_id, created_at=timezone.now(), state="PE", delivery_cost=delivery_cost)
-    for item in cart_items:
-        price = item.product.price_on_sale if item.product.price_on_sale else item.product.price
-        OrderItem.objects.create(order=order, product=item.product, size=item.size, colour=item.colour, quantity=item.quantity, unit_price=price)
-    
-    order.save()
-    cart.items.all().delete()
+    # The order is created from a database cart, also for the anonymous ones
+    try:
+        with transaction.atomic():
+            order = create_order(stored_cart.persist())
+            stored_cart.clear()
+    except OutOfStock as e:
+        return redirect_short_stock(request, e.items)
 
     return redirect('order_info', order_id=order.pk)
 
+@require_http_methods(['GET', 'POST'])
+def checkout(request):
+    # One page checkout: delivery, contact and payment method in one form, whose POST creates
+    # the order and starts the card payment or confirms the cash on delivery one
+    if request.user.is_staff:
+        messages.error(request, "Esta vista es sólo para clientes.")
+        return redirect('home')
+
+    cart = get_or_create_cart(request)
+    totals = cart.get_totals()
+    if not any(i.quantity > 0 for i in totals.items):
+        messages.error(request, "El carrito está vacío.")
+        return redirect('cart')
+
+    delivery_cost = DeliveryCost.objects.first().delivery_cost
+    total, tax_amount = compute_prices(round_price(totals.subtotal), delivery_cost, Order.tax_percentage)
+    context = {
+        "items": totals.items,
+        "subtotal": totals.subtotal,
+        "delivery_cost": delivery_cost,
+        "total_price": total,
+        "tax_amount": tax_amount,
+        "tax_percentage": Order.tax_percentage,
+        "data": request.POST,
+    }
+
+    if request.method == 'POST':
+        info, error = parse_order_info(request.POST)
+        method = request.POST.get('method')
+        if error == None and method not in ('card', 'cod'):
+            error = "Debe seleccionar un método de pago."
+        if error != None:
+            messages.error(request, error)
+            return render(request, 'cart/checkout.html', context)
+
+        short_items = get_short_lines(totals.items)
+        if short_items:
+            return redirect_short_stock(request, short_items)
+
+        # A cash order takes its stock in the same transaction, so nothing is stored (and the cart
+        # is kept) when another payment took the units meanwhile
+        try:
+            with transaction.atomic():
+                order = create_order(cart.persist())
+                apply_order_info(order, info, delivery_cost)
+                order.payment_method = 'CC' if method == 'card' else 'CA'
+                order.save()
+                if method == 'cod':
+                    take_cash_payment(order)
+                cart.clear()
+        except OutOfStock as e:
+            return redirect_short_stock(request, e.items)
+
+        if method == 'card':
+            return render_payment_form(request, order)
+
+        send_confirmation(request, order)
+        return redirect('payment_ok', order_id=order.pk)
+
+    return render(request, 'cart/checkout.html', context)
+
 # Payment views
 # Example credit card for testing: 4548812049400004
 
@@ -229,7 +309,12 @@ def start_payment(request, order_id):
     if order.payment_method != 'CC':
         messages.error(request, "El método de pago seleccionado no es válido para este pedido.")
         return redirect('home')
-    
+
+    return render_payment_form(request, order)
+
+def render_payment_form(request, order):
+    # Page that submits the card payment of the order to Redsys
+    order_id = order.pk
     secret_key = os.environ['REDSYS_SECRET_KEY']
     merchant_code = os.environ['REDSYS_MERCHANT_CODE']
     currency = os.environ['REDSYS_CURRENCY']
@@ -280,6 +365,9 @@ def start_payment(request, order_id):
         "redsys_url": redsys_url,
     })
 
+def get_tracking_number(order):
+    return order.tracking_number or str(uuid.uuid4())
+
 @csrf_exempt
 def payment_notification(request, order_id):
     
@@ -319,26 +407,14 @@ def payment_notification(request, order_id):
             try:
                 order = Order.objects.get(id=int(order_id))
                 if order.state == 'PE':
-                    order.state = 'PR'
-                    for item in order.items.all():
-                        stock_obj = ProductStock.objects.get(
-                            product=item.product,
-                            size=item.size,
-                            colour=item.colour,
+                    # The payment is already done, so missing units leave the stock at 0
+                    with transaction.atomic():
+                        decrement_stock(order.items.all(), clamp=True, order=order)
+                        order.apply_changes(state='PR', tracking_number=get_tracking_number(order))
+
+                    tracking_url = request.build_absolute_uri(
+                        reverse('order_tracking', kwargs={'tracking_number': order.tracking_number})
                         )
-                        if stock_obj.stock >= item.quantity:
-                            stock_obj.stock -= item.quantity
-                        else:
-                            stock_obj.stock = 0
-                        stock_obj.save()
-                    order.save()
-
-                    if not order.tracking_number:
-                        order.tracking_number = str(uuid.uuid4())
-                        order.save()
-                        tracking_url = request.build_absolute_uri(
-                            reverse('order_tracking', kwargs={'tracking_number': order.tracking_number})
-                            )
                     if request.user.is_authenticated:
                         recipient = request.user.email
                     else:
@@ -376,6 +452,39 @@ def payment_error(request, order_id):
         return redirect('home')
     return render(request, 'cart/payment_error.html', {"order": order})
 
+def take_cash_payment(order):
+    # Takes the stock and confirms the order, raises OutOfStock when there is no stock
+    with transaction.atomic():
+        short_items = decrement_stock(order.items.select_related('product', 'size', 'colour'), order=order)
+        if short_items:
+            # Another payment took the stock after the check
+            raise OutOfStock(short_items)
+        order.apply_changes(payment_method='CA', state='PR', tracking_number=get_tracking_number(order))
+
+def send_confirmation(request, order):
+    tracking_url = request.build_absolute_uri(
+        reverse('order_tracking', kwargs={'tracking_number': order.tracking_number})
+        )
+    if request.user.is_authenticated:
+        recipient = request.user.email
+    else:
+        recipient = order.client_email
+    send_order_confirmation_email(order, tracking_url, recipient)
+
+def confirm_cash_payment(request, order):
+    # Returns the short items when there is no stock
+    try:
+        take_cash_payment(order)
+    except OutOfStock as e:
+        return e.items
+    send_confirmation(request, order)
+    return []
+
+def redirect_short_stock(request, short_items):
+    item = short_items[0]
+    messages.error(request, f"No hay suficiente stock para el producto {item.product.name} en la talla {item.size.name} y color {item.colour.name}.")
+    return redirect('cart')
+
 @require_http_methods(['GET', 'POST'])
 def payment_method(request, order_id):
     try:
@@ -404,53 +513,18 @@ def payment_method(request, order_id):
 
     # Verify stock
     if request.method == 'POST':
-        for item in order.items.all():
-            try:
-                stock = ProductStock.objects.get(
-                    product=item.product,
-                    size=item.size,
-                    colour=item.colour,
-                )
-            except ProductStock.DoesNotExist:
-                stock = None
-
-            if stock is None or stock.stock < item.quantity:
-                messages.error(request, f"No hay suficiente stock para el producto {item.product.name} en la talla {item.size.name} y color {item.colour.name}.")
-                return redirect('cart')
+        short_items = get_short_lines(order.items.select_related('product', 'size', 'colour'), order=order)
+        if short_items:
+            return redirect_short_stock(request, short_items)
 
     if request.method == 'POST' and request.POST.get('method') == 'card':
-        order.payment_method = 'CC'
-        order.save()
+        order.apply_changes(payment_method='CC')
         return start_payment(request, order_id)
     
     if request.method == 'POST' and request.POST.get('method') == 'cod':
-        order.payment_method = 'CA'
-        order.state = 'PR'
-        for item in order.items.all():
-            stock = ProductStock.objects.get(
-                product=item.product,
-                size=item.size,
-                colour=item.colour,
-            )
-            if stock.stock >= item.quantity:
-                stock.stock -= item.quantity
-            else:
-                stock.stock = 0
-            stock.save()
-        order.save()
-
-        if not order.tracking_number:
-            order.tracking_number = str(uuid.uuid4())
-            order.save()
-            tracking_url = request.build_absolute_uri(
-                reverse('order_tracking', kwargs={'tracking_number': order.tracking_number})
-                )
-        if request.user.is_authenticated:
-            recipient = request.user.email
-        else:
-            recipient = order.client_email
-        send_order_confirmation_email(order, tracking_url, recipient)
-        
+        short_items = confirm_cash_payment(request, order)
+        if short_items:
+            return redirect_short_stock(request, short_items)
         return redirect('payment_ok', order_id=order_id)
 
     return render(request, 'cart/payment_method.html', {"order": order})
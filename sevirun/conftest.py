@@ -0,0 +1,9 @@
+import pytest
+from django.core.cache import caches
+
+# The caches outlive the per-test database rollback
+@pytest.fixture(autouse=True)
+def clear_cache():
+    for cache in caches.all():
+        cache.clear()
+    yield
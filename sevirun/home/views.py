@@ -3,13 +3,24 @@ from products.models import Product
 from django.http import HttpResponse
 
 from products.forms import ProductFiltersForm
+from products.pagination import sort_products, keyset_paginate, is_fragment_request
+from products.catalog import get_matching_facet_counts
+from products.cards import get_product_cards
 
 def home(request):
     products = Product.objects.all().filter(is_highlighted=True, is_deleted=False)
+    products, ordering = sort_products(products, 'newest')
+    page = keyset_paginate(products.only('pk', 'created_at'), ordering, request.GET.get('cursor'))
+
     context = {
-        'products': products,
-        'filters': ProductFiltersForm()
+        'products': get_product_cards(page.items),
+        'next_page_url': page.next_url(request)
     }
+
+    if is_fragment_request(request):
+        return render(request, 'home/highlighted_page.html', context)
+
+    context['filters'] = ProductFiltersForm(counts=get_matching_facet_counts(Product.objects.filter(is_deleted=False)))
     return render(request, 'home/home.html', context)
 
 def about(request):
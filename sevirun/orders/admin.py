@@ -1,8 +1,9 @@
 from django.contrib import admin
-from .models import Order, OrderItem, DeliveryCost
+from .models import Order, OrderItem, OrderStateChange, DeliveryCost
 
 # Register your models here.
 
 admin.site.register(Order)
 admin.site.register(OrderItem)
+admin.site.register(OrderStateChange)
 admin.site.register(DeliveryCost)
\ No newline at end of file
@@ -0,0 +1,18 @@
+from datetime import datetime, time, timedelta
+from django.utils import timezone
+
+def start_of_day(date):
+    return timezone.make_aware(datetime.combine(date, time.min))
+
+def filter_orders(params, orders):
+    # params: cleaned data of OrderFiltersForm. Dates are compared as ranges of created_at so
+    # the (state, created_at) and (created_at, id) indexes apply
+    if params.get('state'):
+        orders = orders.filter(state=params['state'])
+    if params.get('type'):
+        orders = orders.filter(type=params['type'])
+    if params.get('date_from'):
+        orders = orders.filter(created_at__gte=start_of_day(params['date_from']))
+    if params.get('date_to'):
+        orders = orders.filter(created_at__lt=start_of_day(params['date_to'] + timedelta(days=1)))
+    return orders
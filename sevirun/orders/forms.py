@@ -0,0 +1,16 @@
+from django import forms
+from .models import OrderState, OrderType
+
+class OrderFiltersForm(forms.Form):
+    state = forms.ChoiceField(required = False, label = 'Estado', choices = [('', 'Todos')] + OrderState.choices)
+    type = forms.ChoiceField(required = False, label = 'Modo de envío', choices = [('', 'Todos')] + OrderType.choices)
+    date_from = forms.DateField(required = False, label = 'Desde', widget = forms.DateInput(attrs = {'type': 'date'}))
+    date_to = forms.DateField(required = False, label = 'Hasta', widget = forms.DateInput(attrs = {'type': 'date'}))
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        for field in self.fields:
+            self.fields[field].widget.attrs['class'] = 'd-flex form-select'
+        for field in ('date_from', 'date_to'):
+            self.fields[field].widget.attrs['class'] = 'd-flex form-control'
@@ -0,0 +1,60 @@
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .filters import start_of_day
+from .models import OrderState, OrderStateChange, OrderStateDay
+
+# Days recomputed by default: yesterday, for the changes logged after its last rollup, and today
+ROLLUP_DAYS = 2
+
+def rollup_state_history(since, until=None):
+    # Recomputes the OrderStateDay rows of the days from since to until (both included) with
+    # two aggregate queries over the history. Returns the number of rows stored
+    until = until or timezone.localdate()
+    changes = OrderStateChange.objects.filter(
+        created_at__gte=start_of_day(since),
+        created_at__lt=start_of_day(until + timedelta(days=1))
+    ).annotate(day=TruncDate('created_at')).order_by()
+
+    rows = {}
+    def row(day, state):
+        return rows.setdefault((day, state), OrderStateDay(day=day, state=state))
+
+    for r in changes.values('day', 'state').annotate(count=Count('pk')):
+        row(r['day'], r['state']).entered = r['count']
+
+    exits = changes.values('day', 'from_state').annotate(count=Count('pk'), total=Sum('seconds_in_state'), longest=Max('seconds_in_state'))
+    for r in exits:
+        day = row(r['day'], r['from_state'])
+        day.exited, day.total_seconds, day.max_seconds = r['count'], r['total'], r['longest']
+
+    with transaction.atomic():
+        OrderStateDay.objects.filter(day__gte=since, day__lte=until).delete()
+        OrderStateDay.objects.bulk_create(rows.values())
+    return len(rows)
+
+def summarize_state_days(since):
+    # Totals per state of the rollup rows since the given day, in the order of OrderState
+    labels = dict(OrderState.choices)
+    totals = {
+        r['state']: r for r in OrderStateDay.objects.filter(day__gte=since).values('state').annotate(
+            entered=Sum('entered'), exited=Sum('exited'), total=Sum('total_seconds'), longest=Max('max_seconds')
+        ).order_by()
+    }
+
+    summary = []
+    for state in OrderState.values:
+        r = totals.get(state)
+        if r == None:
+            continue
+        summary.append({
+            'state': state,
+            'label': labels[state],
+            'entered': r['entered'],
+            'exited': r['exited'],
+            'average_hours': round(r['total'] / r['exited'] / 3600, 1) if r['exited'] else None,
+            'max_hours': round(r['longest'] / 3600, 1),
+        })
+    return summary
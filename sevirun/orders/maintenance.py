@@ -0,0 +1,63 @@
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.db import connection
+from django.utils import timezone
+from cart.models import Cart
+from .models import Order, OrderState
+from .transitions import apply_transitions
+
+MAINTENANCE_BATCH_SIZE = 500
+
+# Session engines whose sessions are rows of django_session
+DATABASE_SESSION_ENGINES = ['django.contrib.sessions.backends.db', 'django.contrib.sessions.backends.cached_db']
+
+def report(progress, total):
+    if progress != None:
+        progress(total)
+
+def cancel_stale_orders(before, batch_size=MAINTENANCE_BATCH_SIZE, progress=None):
+    # Cancels the orders still pending payment created before the given date and drops their
+    # reservations, batch_size orders per transaction (logged in the state history). Returns the
+    # number of cancelled orders
+    stale = Order.objects.filter(state=OrderState.PENDING, created_at__lt=before)
+    total = 0
+
+    while True:
+        ids = list(stale.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return total
+
+        total += apply_transitions({OrderState.CANCELLED: ids})
+        report(progress, total)
+
+def delete_in_batches(queryset, batch_size=MAINTENANCE_BATCH_SIZE, progress=None):
+    # Deletes the rows of the queryset batch_size at a time, so no statement locks the table for
+    # long. Returns the number of deleted rows (not counting cascades)
+    total = 0
+
+    while True:
+        ids = list(queryset.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return total
+
+        queryset.model.objects.filter(pk__in=ids).delete()
+        total += len(ids)
+        report(progress, total)
+
+def delete_orphan_carts(before, batch_size=MAINTENANCE_BATCH_SIZE, progress=None):
+    # Anonymous carts are kept in the session, so their rows (left by orders or older versions)
+    # are not used once the session is gone
+    return delete_in_batches(Cart.objects.filter(client__isnull=True, updated_at__lt=before), batch_size, progress)
+
+def delete_expired_sessions(now=None, batch_size=MAINTENANCE_BATCH_SIZE, progress=None):
+    if settings.SESSION_ENGINE not in DATABASE_SESSION_ENGINES:
+        return 0
+    return delete_in_batches(Session.objects.filter(expire_date__lt=now or timezone.now()), batch_size, progress)
+
+def vacuum_database():
+    # Returns the freed pages to the file system and refreshes the planner statistics. VACUUM
+    # cannot run inside a transaction, so only ANALYZE does there
+    with connection.cursor() as cursor:
+        if connection.vendor in ('sqlite', 'postgresql') and not connection.in_atomic_block:
+            cursor.execute('VACUUM')
+        cursor.execute('ANALYZE')
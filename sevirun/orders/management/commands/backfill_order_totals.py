@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from orders.models import Order, OrderItem
+from orders.totals import BACKFILL_BATCH_SIZE, backfill_order_totals
+
+class Command(BaseCommand):
+    help = 'Recomputes the stored totals (subtotal, units, tax and total) of every order'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BACKFILL_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        count = backfill_order_totals(
+            Order, OrderItem, Order.tax_percentage, options['batch_size'],
+            lambda total: self.stdout.write(f'  Orders updated: {total}')
+        )
+        self.stdout.write(self.style.SUCCESS(f'{count} order totals stored.'))
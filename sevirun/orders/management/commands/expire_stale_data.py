@@ -0,0 +1,37 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from orders.maintenance import (
+    MAINTENANCE_BATCH_SIZE,
+    cancel_stale_orders,
+    delete_expired_sessions,
+    delete_orphan_carts,
+    vacuum_database,
+)
+
+class Command(BaseCommand):
+    help = 'Cancels unpaid orders, deletes orphan anonymous carts and expired sessions, then compacts the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--order-age', type=int, default=48, help='Hours after which a pending order is cancelled')
+        parser.add_argument('--cart-age', type=int, default=30, help='Days after which an anonymous cart is deleted')
+        parser.add_argument('--batch-size', type=int, default=MAINTENANCE_BATCH_SIZE)
+        parser.add_argument('--skip-vacuum', action='store_true')
+
+    def progress(self, label):
+        return lambda total: self.stdout.write(f'  {label}: {total}')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        batch_size = options['batch_size']
+
+        orders = cancel_stale_orders(now - timedelta(hours=options['order_age']), batch_size, self.progress('Pending orders cancelled'))
+        carts = delete_orphan_carts(now - timedelta(days=options['cart_age']), batch_size, self.progress('Orphan carts deleted'))
+        sessions = delete_expired_sessions(now, batch_size, self.progress('Expired sessions deleted'))
+
+        if not options['skip_vacuum']:
+            vacuum_database()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{orders} pending orders cancelled, {carts} orphan carts and {sessions} expired sessions deleted.'
+        ))
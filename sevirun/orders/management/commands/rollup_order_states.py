@@ -0,0 +1,15 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from orders.history import ROLLUP_DAYS, rollup_state_history
+
+class Command(BaseCommand):
+    help = 'Recomputes the daily rollup of the order state history used by the SLA dashboard (meant to run periodically)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=ROLLUP_DAYS, help='Number of days to recompute, ending today')
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        rows = rollup_state_history(today - timedelta(days=max(options['days'], 1) - 1), today)
+        self.stdout.write(self.style.SUCCESS(f'{rows} daily state rows stored.'))
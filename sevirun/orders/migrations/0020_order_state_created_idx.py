@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0019_merge_20251122_2034'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['state', 'created_at'], name='order_state_created_idx'),
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:20
+
+from decimal import Decimal, ROUND_CEILING
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+
+# Frozen copy of the totals computation of this version (orders.totals may change later)
+TAX_PERCENTAGE = 21
+BATCH_SIZE = 500
+
+
+def round_price(value):
+    return Decimal(value).quantize(Decimal("0.01"), rounding=ROUND_CEILING)
+
+
+def populate_order_totals(apps, schema_editor):
+    Order = apps.get_model('orders', 'Order')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    line_total = ExpressionWrapper(F('quantity') * F('unit_price'), output_field=DecimalField(max_digits=10, decimal_places=2))
+    last_pk = 0
+
+    while True:
+        orders = list(Order.objects.filter(pk__gt=last_pk).order_by('pk')[:BATCH_SIZE])
+        if not orders:
+            return
+
+        rows = {
+            r['order']: r for r in OrderItem.objects.filter(order__in=orders).values('order')
+                .annotate(subtotal=Sum(line_total), units=Sum('quantity'), count=Count('pk')).order_by()
+        }
+        for order in orders:
+            row = rows.get(order.pk, {})
+            order.subtotal = round_price(row.get('subtotal') or 0)
+            order.total_units = row.get('units') or 0
+            order.items_count = row.get('count') or 0
+            order.total_price = round_price(order.subtotal + Decimal(str(order.delivery_cost)))
+            tax = order.total_price - Decimal(order.total_price / Decimal(1 + (TAX_PERCENTAGE / 100)))
+            order.tax_amount = round_price(tax)
+        Order.objects.bulk_update(orders, ['subtotal', 'total_units', 'items_count', 'total_price', 'tax_amount'])
+
+        last_pk = orders[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0020_order_state_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='items_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='tax_amount',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total_price',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total_units',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_order_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0022_order_created_at_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='state_changed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='OrderStateDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('state', models.CharField(choices=[('PE', 'Pendiente de pago'), ('PR', 'En proceso'), ('SH', 'Enviado'), ('DE', 'Entregado'), ('CA', 'Cancelado')])),
+                ('entered', models.PositiveIntegerField(default=0)),
+                ('exited', models.PositiveIntegerField(default=0)),
+                ('total_seconds', models.PositiveBigIntegerField(default=0)),
+                ('max_seconds', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'state'), name='order_state_day_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='OrderStateChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_state', models.CharField(choices=[('PE', 'Pendiente de pago'), ('PR', 'En proceso'), ('SH', 'Enviado'), ('DE', 'Entregado'), ('CA', 'Cancelado')])),
+                ('state', models.CharField(choices=[('PE', 'Pendiente de pago'), ('PR', 'En proceso'), ('SH', 'Enviado'), ('DE', 'Entregado'), ('CA', 'Cancelado')])),
+                ('created_at', models.DateTimeField()),
+                ('seconds_in_state', models.PositiveIntegerField(default=0)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, related_name='state_changes', to='orders.order')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['state', 'created_at'], name='state_change_state_idx'), models.Index(fields=['order', 'created_at'], name='state_change_order_idx')],
+            },
+        ),
+    ]
@@ -1,9 +1,11 @@
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.core.validators import MaxValueValidator, MinValueValidator, RegexValidator
 from users.models import AppUser
 from products.models import *
-from decimal import Decimal, ROUND_CEILING
+from decimal import Decimal
+from .totals import compute_prices, item_totals, set_totals
 from django.core.exceptions import ValidationError
 from django.core.validators import validate_email
 
@@ -19,6 +21,20 @@ class OrderState(models.TextChoices):
     DELIVERED = "DE", _("Entregado")
     CANCELLED = "CA", _("Cancelado")
 
+# States each state can move to. Cancelled orders have their reservations released, so they
+# are not reopened
+ALLOWED_TRANSITIONS = {
+    OrderState.PENDING: [OrderState.PROCESSING, OrderState.SHIPPED, OrderState.DELIVERED, OrderState.CANCELLED],
+    OrderState.PROCESSING: [OrderState.SHIPPED, OrderState.DELIVERED, OrderState.CANCELLED],
+    OrderState.SHIPPED: [OrderState.DELIVERED, OrderState.CANCELLED],
+    OrderState.DELIVERED: [OrderState.CANCELLED],
+    OrderState.CANCELLED: [],
+}
+
+# States an order may be in without shipping address or phone: unpaid orders and the ones
+# cancelled before completing them
+CONTACT_OPTIONAL_STATES = [OrderState.PENDING, OrderState.CANCELLED]
+
 class PaymentMethod(models.TextChoices):
     CREDIT_CARD = "CC", _("Tarjeta de crédito")
     CASH = "CA", _("Contrareembolso")
@@ -44,6 +60,8 @@ class Order(models.Model):
     type = models.CharField(choices=OrderType, null=True, blank=True)
 
     tracking_number = models.CharField(max_length=255, null=True, blank=True, unique=True)
+    # When the state was last changed (null until the first change, so created_at applies)
+    state_changed_at = models.DateTimeField(null = True, blank = True, editable = False)
 
     class Meta:
         constraints = [
@@ -52,11 +70,10 @@ class Order(models.Model):
                 name='order_has_client_or_session'
             )
         ]
-
-    @property
-    def subtotal(self):
-        result = Decimal(sum(item.total_price for item in self.items.all()))
-        return result.quantize(Decimal("0.01"), rounding=ROUND_CEILING)
+        indexes = [
+            models.Index(fields=['state', 'created_at'], name='order_state_created_idx'),
+            models.Index(fields=['created_at', 'id'], name='order_created_at_idx'),
+        ]
 
     delivery_cost = models.DecimalField(
         max_digits = 5,
@@ -75,51 +92,82 @@ class Order(models.Model):
 
     tax_percentage = 21  # IVA
 
-    @property
-    def tax_amount(self):
-        total = self.total_price
-        tax = total - Decimal(total / Decimal(1 + (self.tax_percentage / 100)))
-        return tax.quantize(Decimal("0.01"), rounding=ROUND_CEILING)
-
-    @property
-    def total_price(self):
-        subtotal = self.subtotal
-        delivery = self.delivery_cost 
-        result = Decimal((subtotal + delivery))
-        return result.quantize(Decimal("0.01"), rounding=ROUND_CEILING)
-
-    @property
-    def items_count(self):
-        return self.items.count()
-
-    @property
-    def total_units(self):
-        return sum(item.quantity for item in self.items.all())
+    # Totals of the items, stored when the order is created and recomputed by refresh_totals
+    # when its items change. The total and tax also follow the delivery cost on every save
+    subtotal = models.DecimalField(max_digits = 10, decimal_places = 2, null = False, default = 0, editable = False)
+    total_units = models.PositiveIntegerField(null = False, default = 0, editable = False)
+    items_count = models.PositiveIntegerField(null = False, default = 0, editable = False)
+    tax_amount = models.DecimalField(max_digits = 10, decimal_places = 2, null = False, default = 0, editable = False)
+    total_price = models.DecimalField(max_digits = 10, decimal_places = 2, null = False, default = 0, editable = False)
+
+    def refresh_totals(self):
+        row = OrderItem.objects.filter(order=self).aggregate(**item_totals())
+        set_totals(self, row.get('subtotal'), row.get('units'), row.get('count'), self.tax_percentage)
+        Order.objects.filter(pk=self.pk).update(
+            subtotal=self.subtotal,
+            total_units=self.total_units,
+            items_count=self.items_count,
+            tax_amount=self.tax_amount,
+            total_price=self.total_price,
+        )
+
+    def has_contact(self):
+        return bool(self.shipping_address and self.phone_number)
+
+    def can_transition(self, state):
+        # Same rule as clean: only pending and cancelled orders may lack the shipping address or phone
+        return state in ALLOWED_TRANSITIONS[self.state] and (state in CONTACT_OPTIONAL_STATES or self.has_contact())
+
+    def state_choices(self):
+        # The current state and the ones the order can move to
+        return [(s, label) for s, label in OrderState.choices if s == self.state or self.can_transition(s)]
 
     def clean(self):
         super().clean()
-        is_pending = self.state == OrderState.PENDING
-        
-        if not is_pending:
+        if self.state not in CONTACT_OPTIONAL_STATES:
             errors = {}
             
             if not self.shipping_address:
                 errors['shipping_address'] = (
-                    'Shipping address is required unless order state is pending.'
+                    'Shipping address is required unless order state is pending or cancelled.'
                 )
             
             if not self.phone_number:
                 errors['phone_number'] = (
-                    'Phone number is required unless order state is pending.'
+                    'Phone number is required unless order state is pending or cancelled.'
                 )
             
             if errors:
                 raise ValidationError(errors)
     
     def save(self, *args, **kwargs):
+        self.total_price, self.tax_amount = compute_prices(self.subtotal, self.delivery_cost, self.tax_percentage)
         self.full_clean()
         super().save(*args, **kwargs)
 
+    def apply_changes(self, **fields):
+        # Fast path for state, payment method and tracking number changes: validates only the
+        # given fields (no full_clean, so no unique lookup of tracking_number, which the unique
+        # index still enforces) and writes just them. A state change is logged in the history
+        previous_state = self.state
+        for name, value in fields.items():
+            setattr(self, name, value)
+        self.clean_fields(exclude=[f.name for f in self._meta.fields if f.name not in fields])
+
+        if 'state' in fields and self.state not in CONTACT_OPTIONAL_STATES and not self.has_contact():
+            raise ValidationError({'state': 'Shipping address and phone number are required unless order state is pending or cancelled.'})
+
+        if self.state == previous_state:
+            super().save(update_fields=list(fields))
+            return
+
+        now = timezone.now()
+        change = OrderStateChange.for_transition(self.pk, previous_state, self.state, self.state_changed_at or self.created_at, now)
+        self.state_changed_at = now
+        with transaction.atomic():
+            super().save(update_fields=list(fields) + ['state_changed_at'])
+            change.save()
+
     def __str__(self):
         return f'''
                 {{
@@ -134,6 +182,41 @@ class Order(models.Model):
                 }}
                 '''
 
+class OrderStateChange(models.Model):
+    # Append-only log of the state changes, for the time spent in each state
+    order = models.ForeignKey(Order, on_delete=models.DO_NOTHING, null=False, related_name="state_changes")
+    from_state = models.CharField(choices=OrderState, null=False)
+    state = models.CharField(choices=OrderState, null=False)
+    created_at = models.DateTimeField(null = False)
+    seconds_in_state = models.PositiveIntegerField(null = False, default = 0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['state', 'created_at'], name='state_change_state_idx'),
+            models.Index(fields=['order', 'created_at'], name='state_change_order_idx'),
+        ]
+
+    @classmethod
+    def for_transition(cls, order_id, from_state, state, entered_at, now):
+        # Unsaved row of an order leaving from_state, which it entered at entered_at
+        seconds = max(int((now - entered_at).total_seconds()), 0)
+        return cls(order_id=order_id, from_state=from_state, state=state, created_at=now, seconds_in_state=seconds)
+
+class OrderStateDay(models.Model):
+    # Per day and state rollup of the history (see orders.history): orders that entered and
+    # left the state that day, and the time the leaving ones spent in it
+    day = models.DateField(null = False)
+    state = models.CharField(choices=OrderState, null=False)
+    entered = models.PositiveIntegerField(null = False, default = 0)
+    exited = models.PositiveIntegerField(null = False, default = 0)
+    total_seconds = models.PositiveBigIntegerField(null = False, default = 0)
+    max_seconds = models.PositiveIntegerField(null = False, default = 0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'state'], name='order_state_day_unique')
+        ]
+
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.DO_NOTHING, null=False, related_name="items")
     product = models.ForeignKey(Product, on_delete=models.DO_NOTHING, null=False)
@@ -0,0 +1,12 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import Order, OrderItem
+
+# Items created in bulk with the order (cart.checkout) get their totals there
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def refresh_order_totals(sender, instance, **kwargs):
+    order = Order.objects.filter(pk=instance.order_id).first()
+    if order != None:
+        order.refresh_totals()
@@ -0,0 +1,48 @@
+import io
+import pytest
+from datetime import timedelta
+from django.contrib.sessions.models import Session
+from django.core.management import call_command
+from django.utils import timezone
+from cart.models import Cart
+from orders.maintenance import cancel_stale_orders
+from orders.models import *
+from orders.test_fixtures import *
+
+@pytest.mark.django_db
+def test_expire_stale_data(order_list):
+    [delivered_order, pending_order] = order_list
+    recent_order = Order.objects.create(client=pending_order.client, created_at=timezone.now(), delivery_cost=Decimal('5.5'))
+
+    old_cart = Cart.objects.create(session_id='old')
+    Cart.objects.create(session_id='recent')
+    Cart.objects.filter(pk=old_cart.pk).update(updated_at=timezone.now() - timedelta(days=60))
+
+    Session.objects.create(session_key='expired', session_data='', expire_date=timezone.now() - timedelta(days=1))
+    Session.objects.create(session_key='active', session_data='', expire_date=timezone.now() + timedelta(days=1))
+
+    output = io.StringIO()
+    call_command('expire_stale_data', '--batch-size', '1', stdout=output)
+
+    pending_order.refresh_from_db()
+    delivered_order.refresh_from_db()
+    recent_order.refresh_from_db()
+    assert pending_order.state == OrderState.CANCELLED
+    assert delivered_order.state == OrderState.DELIVERED
+    assert recent_order.state == OrderState.PENDING
+
+    assert list(Cart.objects.values_list('session_id', flat=True)) == ['recent']
+    assert list(Session.objects.values_list('session_key', flat=True)) == ['active']
+    assert '1 pending orders cancelled, 1 orphan carts and 1 expired sessions deleted.' in output.getvalue()
+
+@pytest.mark.django_db
+def test_cancelled_orders_without_contact_stay_valid(order_list):
+    [delivered_order, pending_order] = order_list
+    Order.objects.filter(pk=pending_order.pk).update(shipping_address=None, phone_number=None)
+
+    assert cancel_stale_orders(timezone.now() + timedelta(days=1)) == 1
+
+    pending_order.refresh_from_db()
+    assert pending_order.state == OrderState.CANCELLED
+    pending_order.full_clean()
+    pending_order.save()
@@ -1,4 +1,5 @@
 import pytest
+from decimal import ROUND_CEILING
 from django.urls import reverse
 from orders.models import *
 from orders.test_fixtures import *
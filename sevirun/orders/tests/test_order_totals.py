@@ -0,0 +1,42 @@
+import io
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+from orders.models import *
+from orders.test_fixtures import *
+
+@pytest.mark.django_db
+def test_order_totals_follow_items(order_and_items_list):
+    order = order_and_items_list
+    order.refresh_from_db()
+
+    assert order.subtotal == Decimal('186.80')
+    assert order.total_units == 3
+    assert order.items_count == 2
+    assert order.total_price == Decimal('192.30')
+    assert order.tax_amount == Decimal('33.38')
+
+    order.items.filter(unit_price=Decimal('75.00')).get().delete()
+    order.refresh_from_db()
+    assert order.subtotal == Decimal('111.80')
+    assert order.total_units == 2
+
+@pytest.mark.django_db
+def test_backfill_order_totals(order_and_items_list):
+    Order.objects.update(subtotal=0, total_units=0, items_count=0, total_price=0, tax_amount=0)
+
+    call_command('backfill_order_totals', '--batch-size', '1', stdout=io.StringIO())
+    order = Order.objects.get(pk=order_and_items_list.pk)
+
+    assert order.subtotal == Decimal('186.80')
+    assert order.total_price == Decimal('192.30')
+    assert Order.objects.exclude(pk=order.pk).get().total_price == Decimal('5.50')
+
+@pytest.mark.django_db
+def test_orders_list_is_one_query(client, staff_user, order_and_items_list, django_assert_max_num_queries):
+    client.force_login(staff_user)
+
+    # Session, user and the orders
+    with django_assert_max_num_queries(3):
+        response = client.get(reverse('orders'))
+    assert b'192,30' in response.content
@@ -1,7 +1,10 @@
 import pytest
+from decimal import ROUND_CEILING
 from django.urls import reverse
 from orders.models import *
 from orders.test_fixtures import *
+from datetime import timedelta
+from django.utils import timezone
 
 @pytest.mark.django_db
 def test_orders_access_as_unauthenticated(client):
@@ -136,3 +139,47 @@ def test_orders_do_not_change_multiple_states_on_client_post(client, regular_use
     assert b'Enviado' not in response.content
     assert Order.objects.get(pk = 1).state != 'CA'
     assert Order.objects.get(pk = 2).state != 'SH'
+
+@pytest.fixture
+def many_orders(regular_user):
+    now = timezone.now()
+    return Order.objects.bulk_create([
+        Order(
+            client = regular_user,
+            created_at = now - timedelta(days = i),
+            state = 'PR' if i % 2 else 'PE',
+            type = 'HD',
+            delivery_cost = Decimal('5.5'),
+        )
+        for i in range(30)
+    ])
+
+@pytest.mark.django_db
+def test_staff_orders_are_paginated(client, staff_user, many_orders, django_assert_max_num_queries):
+    client.force_login(staff_user)
+
+    with django_assert_max_num_queries(3):
+        response = client.get(reverse('orders'))
+    first_page = response.context['orders']
+    assert len(first_page) == 24
+    assert first_page[0].created_at > first_page[-1].created_at
+
+    response = client.get(response.context['next_page_url'], headers = {'X-Requested-With': 'XMLHttpRequest'})
+    assert len(response.context['orders']) == 6
+    assert response.context['next_page_url'] == None
+    assert any(t.name == 'orders/orders_page.html' for t in response.templates)
+
+@pytest.mark.django_db
+def test_staff_orders_filters(client, staff_user, many_orders):
+    client.force_login(staff_user)
+    today = timezone.localdate()
+
+    response = client.get(reverse('orders'), {'state': 'PR'})
+    assert len(response.context['orders']) == 15
+    assert all(o.state == 'PR' for o in response.context['orders'])
+
+    response = client.get(reverse('orders'), {'date_from': today - timedelta(days = 2), 'date_to': today, 'type': 'HD'})
+    assert len(response.context['orders']) == 3
+
+    response = client.get(reverse('orders'), {'type': 'SP'})
+    assert len(response.context['orders']) == 0
@@ -0,0 +1,104 @@
+import io
+import pytest
+from datetime import timedelta
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from orders.history import rollup_state_history
+from orders.maintenance import cancel_stale_orders
+from orders.models import *
+from orders.test_fixtures import *
+
+def history(order):
+    return list(order.state_changes.order_by('pk').values_list('from_state', 'state'))
+
+@pytest.mark.django_db
+def test_apply_changes_logs_state_change(order_list):
+    [delivered_order, pending_order] = order_list
+    Order.objects.filter(pk=pending_order.pk).update(created_at=timezone.now() - timedelta(hours=2))
+    pending_order.refresh_from_db()
+
+    pending_order.apply_changes(tracking_number='abc')
+    pending_order.apply_changes(state='PR')
+
+    change = pending_order.state_changes.get()
+    assert (change.from_state, change.state) == ('PE', 'PR')
+    assert 7200 <= change.seconds_in_state < 7300
+    assert Order.objects.get(pk=pending_order.pk).state_changed_at == change.created_at
+
+@pytest.mark.django_db
+def test_transitions_log_state_changes(client, staff_user, order_list):
+    [delivered_order, pending_order] = order_list
+    client.force_login(staff_user)
+
+    client.post(reverse('orders'), {f'order-{pending_order.pk}-state': 'PR'})
+    client.post(reverse('orders_transition'), {f'order-{pending_order.pk}-state': 'SH'})
+    client.post(reverse('order_detail', args=[pending_order.pk]), {f'order-{pending_order.pk}-state': 'DE'})
+    client.post(reverse('order_detail', args=[delivered_order.pk]), {f'order-{delivered_order.pk}-state': 'PE'})
+
+    assert history(pending_order) == [('PE', 'PR'), ('PR', 'SH'), ('SH', 'DE')]
+    assert history(delivered_order) == []
+
+@pytest.mark.django_db
+def test_cancel_stale_orders_logs_state_changes(order_list):
+    [delivered_order, pending_order] = order_list
+
+    assert cancel_stale_orders(timezone.now() + timedelta(days=1)) == 1
+    assert history(pending_order) == [('PE', 'CA')]
+
+@pytest.mark.django_db
+def test_rollup_state_history(order_list):
+    [delivered_order, pending_order] = order_list
+    today = timezone.localdate()
+    yesterday = timezone.now() - timedelta(days=1)
+    OrderStateChange.objects.bulk_create([
+        OrderStateChange(order=pending_order, from_state='PE', state='PR', created_at=yesterday, seconds_in_state=60),
+        OrderStateChange(order=delivered_order, from_state='PE', state='PR', created_at=yesterday, seconds_in_state=120),
+        OrderStateChange(order=pending_order, from_state='PR', state='SH', created_at=timezone.now(), seconds_in_state=3600),
+    ])
+    OrderStateDay.objects.create(day=today - timedelta(days=5), state='PR', entered=3)
+
+    output = io.StringIO()
+    call_command('rollup_order_states', stdout=output)
+
+    rows = {(r.day, r.state): r for r in OrderStateDay.objects.all()}
+    assert len(rows) == 5
+    pending = rows[(today - timedelta(days=1), 'PE')]
+    assert (pending.entered, pending.exited, pending.total_seconds, pending.max_seconds) == (0, 2, 180, 120)
+    assert rows[(today - timedelta(days=1), 'PR')].entered == 2
+    processing = rows[(today, 'PR')]
+    assert (processing.entered, processing.exited, processing.max_seconds) == (0, 1, 3600)
+    assert rows[(today, 'SH')].entered == 1
+    assert '4 daily state rows stored.' in output.getvalue()
+
+    assert rollup_state_history(today - timedelta(days=5), today) == 4
+    assert not OrderStateDay.objects.filter(day=today - timedelta(days=5)).exists()
+
+@pytest.mark.django_db
+def test_sla_dashboard_reads_rollup(client, staff_user):
+    today = timezone.localdate()
+    OrderStateDay.objects.bulk_create([
+        OrderStateDay(day=today, state='PR', entered=2, exited=2, total_seconds=7200, max_seconds=5400),
+        OrderStateDay(day=today - timedelta(days=1), state='PR', entered=1, exited=1, total_seconds=3600, max_seconds=3600),
+        OrderStateDay(day=today - timedelta(days=60), state='SH', entered=1, exited=1, total_seconds=60, max_seconds=60),
+    ])
+    client.force_login(staff_user)
+
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(reverse('order_sla'), {'days': '7'})
+
+    assert response.status_code == 200
+    assert response.context['summary'] == [{
+        'state': 'PR', 'label': 'En proceso', 'entered': 3, 'exited': 3, 'average_hours': 1.0, 'max_hours': 1.5,
+    }]
+    assert len(response.context['state_days']) == 2
+    assert not any('"orders_order"' in q['sql'] for q in queries.captured_queries)
+
+@pytest.mark.django_db
+def test_sla_dashboard_as_client(client, regular_user):
+    client.force_login(regular_user)
+    response = client.get(reverse('order_sla'))
+
+    assert response.status_code == 302
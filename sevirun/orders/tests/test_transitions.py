@@ -0,0 +1,123 @@
+import pytest
+from datetime import timedelta
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from orders.models import *
+from orders.test_fixtures import *
+from orders.transitions import transition_orders
+
+def create_orders(client, states, days_ago=0):
+    return Order.objects.bulk_create([
+        Order(
+            client = client,
+            created_at = timezone.now() - timedelta(days = days_ago),
+            state = state,
+            delivery_cost = Decimal('5.5'),
+            shipping_address = 'Fake street, 123',
+            phone_number = '+341234356789',
+        )
+        for state in states
+    ])
+
+@pytest.mark.django_db
+def test_transition_groups_updates_by_state(regular_user):
+    orders = create_orders(regular_user, ['PE', 'PE', 'PR', 'SH'])
+    changes = {orders[0].pk: 'PR', orders[1].pk: 'PR', orders[2].pk: 'SH', orders[3].pk: 'SH'}
+
+    with CaptureQueriesContext(connection) as queries:
+        updated, rejected = transition_orders(changes)
+
+    updates = [q for q in queries.captured_queries if q['sql'].startswith('UPDATE "orders_order"')]
+    assert len(updates) == 2
+    assert (updated, rejected) == (3, [])
+    assert [o.state for o in Order.objects.order_by('pk')] == ['PR', 'PR', 'SH', 'SH']
+
+@pytest.mark.django_db
+def test_transition_rejects_invalid_changes(regular_user):
+    [cancelled, pending] = create_orders(regular_user, ['CA', 'PE'])
+    Order.objects.filter(pk=pending.pk).update(phone_number=None)
+
+    updated, rejected = transition_orders({cancelled.pk: 'PR', pending.pk: 'SH', 9999: 'SH'})
+
+    assert updated == 0
+    assert rejected == [cancelled.pk, pending.pk, 9999]
+    assert list(Order.objects.order_by('pk').values_list('state', flat=True)) == ['CA', 'PE']
+
+@pytest.mark.django_db
+def test_transition_endpoint_changes_posted_orders(client, staff_user, order_list):
+    [delivered_order, pending_order] = order_list
+    client.force_login(staff_user)
+
+    response = client.post(reverse('orders_transition'), {
+        f'order-{delivered_order.pk}-state': 'PR',
+        f'order-{pending_order.pk}-state': 'SH',
+    })
+
+    assert response.status_code == 302
+    assert response.url == reverse('orders')
+    assert Order.objects.get(pk=delivered_order.pk).state == 'DE'
+    assert Order.objects.get(pk=pending_order.pk).state == 'SH'
+
+    response = client.get(response.url)
+    assert f'No se puede cambiar el estado de los pedidos #{delivered_order.pk}.'.encode() in response.content
+
+@pytest.mark.django_db
+def test_transition_endpoint_for_filtered_orders(client, staff_user, regular_user):
+    old = create_orders(regular_user, ['PR', 'PR', 'PE'], days_ago=3)
+    recent = create_orders(regular_user, ['PR'])
+    client.force_login(staff_user)
+
+    date_to = (timezone.localdate() - timedelta(days=2)).isoformat()
+    url = reverse('orders_transition') + f'?state=PR&date_to={date_to}'
+    response = client.post(url, {'target_state': 'SH'})
+
+    assert response.status_code == 302
+    assert response.url == reverse('orders') + f'?state=PR&date_to={date_to}'
+    assert [Order.objects.get(pk=o.pk).state for o in old] == ['SH', 'SH', 'PE']
+    assert Order.objects.get(pk=recent[0].pk).state == 'PR'
+
+@pytest.mark.django_db
+def test_transition_endpoint_requires_filters(client, staff_user, regular_user):
+    orders = create_orders(regular_user, ['PR', 'PR'])
+    client.force_login(staff_user)
+
+    response = client.post(reverse('orders_transition'), {'target_state': 'SH'})
+
+    assert response.status_code == 302
+    assert set(Order.objects.values_list('state', flat=True)) == {'PR'}
+
+@pytest.mark.django_db
+def test_transition_endpoint_as_client(client, regular_user, order_list):
+    [delivered_order, pending_order] = order_list
+    client.force_login(regular_user)
+
+    response = client.post(reverse('orders_transition'), {f'order-{pending_order.pk}-state': 'CA'})
+
+    assert response.status_code == 302
+    assert Order.objects.get(pk=pending_order.pk).state == 'PE'
+
+@pytest.mark.django_db
+def test_apply_changes_writes_only_given_fields(regular_user, django_assert_num_queries):
+    [order] = create_orders(regular_user, ['PE'])
+    order.delivery_cost = Decimal('99')
+
+    with django_assert_num_queries(1):
+        order.apply_changes(payment_method='CA', tracking_number='abc')
+    order.apply_changes(state='PR')
+
+    order.refresh_from_db()
+    assert (order.state, order.payment_method, order.tracking_number, order.delivery_cost) == ('PR', 'CA', 'abc', Decimal('5.5'))
+
+@pytest.mark.django_db
+def test_apply_changes_validates_given_fields(regular_user):
+    [order] = create_orders(regular_user, ['PE'])
+
+    with pytest.raises(ValidationError):
+        order.apply_changes(state='XX')
+
+    order.phone_number = None
+    with pytest.raises(ValidationError):
+        order.apply_changes(state='PR')
+    assert Order.objects.get(pk=order.pk).state == 'PE'
@@ -0,0 +1,54 @@
+from decimal import Decimal, ROUND_CEILING
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+
+PRICE_FIELD = DecimalField(max_digits = 10, decimal_places = 2)
+
+# Orders updated per statement by the backfill
+BACKFILL_BATCH_SIZE = 500
+
+def round_price(value):
+    return Decimal(value).quantize(Decimal("0.01"), rounding=ROUND_CEILING)
+
+def compute_prices(subtotal, delivery_cost, tax_percentage):
+    # Total (items and delivery) and the tax included in it
+    total = round_price(Decimal(subtotal) + Decimal(str(delivery_cost)))
+    tax = total - Decimal(total / Decimal(1 + (tax_percentage / 100)))
+    return total, round_price(tax)
+
+def item_totals():
+    # Subtotal, units and line count aggregates of order items
+    return {
+        'subtotal': Sum(ExpressionWrapper(F('quantity') * F('unit_price'), output_field=PRICE_FIELD)),
+        'units': Sum('quantity'),
+        'count': Count('pk'),
+    }
+
+def aggregate_items(items):
+    return items.values('order').annotate(**item_totals()).order_by()
+
+def set_totals(order, subtotal, units, count, tax_percentage):
+    order.subtotal = round_price(subtotal or 0)
+    order.total_units = units or 0
+    order.items_count = count or 0
+    order.total_price, order.tax_amount = compute_prices(order.subtotal, order.delivery_cost, tax_percentage)
+
+def backfill_order_totals(Order, OrderItem, tax_percentage, batch_size=BACKFILL_BATCH_SIZE, progress=None):
+    # Stores the totals of every order, batch_size orders per query
+    total = 0
+    last_pk = 0
+
+    while True:
+        orders = list(Order.objects.filter(pk__gt=last_pk).order_by('pk')[:batch_size])
+        if not orders:
+            return total
+
+        rows = {r['order']: r for r in aggregate_items(OrderItem.objects.filter(order__in=orders))}
+        for order in orders:
+            row = rows.get(order.pk, {})
+            set_totals(order, row.get('subtotal'), row.get('units'), row.get('count'), tax_percentage)
+        Order.objects.bulk_update(orders, ['subtotal', 'total_units', 'items_count', 'total_price', 'tax_amount'])
+
+        last_pk = orders[-1].pk
+        total += len(orders)
+        if progress != None:
+            progress(total)
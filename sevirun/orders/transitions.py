@@ -0,0 +1,78 @@
+import re
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from products.stock import release_order_reservations
+from .models import ALLOWED_TRANSITIONS, CONTACT_OPTIONAL_STATES, Order, OrderState, OrderStateChange
+
+STATE_FIELD = re.compile(r'^order-(\d+)-state$')
+
+def parse_state_changes(data):
+    # {order id: state} of the order-<pk>-state fields holding a known state
+    changes = {}
+    for key, value in data.items():
+        match = STATE_FIELD.match(key)
+        if match and value.strip() in OrderState.values:
+            changes[int(match.group(1))] = value.strip()
+    return changes
+
+def transition_sources(state):
+    return [source for source, targets in ALLOWED_TRANSITIONS.items() if state in targets]
+
+def plan_transitions(changes):
+    # Checks the changes against the current orders in memory, with one query. Returns the
+    # valid ones as {state: [order ids]} and the ids of the rejected orders. Orders already in
+    # the requested state are skipped
+    groups, rejected = {}, set(changes)
+
+    for order in Order.objects.filter(pk__in=changes).only('state', 'shipping_address', 'phone_number'):
+        state = changes[order.pk]
+        if state == order.state:
+            rejected.discard(order.pk)
+        elif order.can_transition(state):
+            rejected.discard(order.pk)
+            groups.setdefault(state, []).append(order.pk)
+
+    return groups, sorted(rejected)
+
+def apply_transitions(groups):
+    # Locks the orders and checks again that each can still reach its target, so an order
+    # changed meanwhile is left alone. Then one UPDATE per target state and one INSERT into the
+    # state history, in a single transaction. Returns the number of updated orders
+    targets = {pk: state for state, ids in groups.items() for pk in ids}
+    now = timezone.now()
+
+    with transaction.atomic():
+        orders = Order.objects.select_for_update().filter(pk__in=targets)\
+            .values_list('pk', 'state', 'state_changed_at', 'created_at')
+        valid, changes = {}, []
+        for pk, state, changed_at, created_at in orders:
+            if targets[pk] in ALLOWED_TRANSITIONS[state]:
+                valid.setdefault(targets[pk], []).append(pk)
+                changes.append(OrderStateChange.for_transition(pk, state, targets[pk], changed_at or created_at, now))
+
+        for state, ids in valid.items():
+            Order.objects.filter(pk__in=ids).update(state=state, state_changed_at=now)
+        OrderStateChange.objects.bulk_create(changes)
+        if OrderState.CANCELLED in valid:
+            release_order_reservations(valid[OrderState.CANCELLED])
+    return len(changes)
+
+def transition_orders(changes):
+    # changes: {order id: state}. Returns (updated orders, rejected order ids)
+    groups, rejected = plan_transitions(changes)
+    return apply_transitions(groups), rejected
+
+def transition_matching(orders, state):
+    # Moves every order of the queryset that can reach the state to it, leaving out the
+    # others. Returns the number of updated orders
+    orders = orders.filter(state__in=transition_sources(state))
+    if state not in CONTACT_OPTIONAL_STATES:
+        orders = orders.exclude(
+            Q(shipping_address__isnull=True) | Q(shipping_address='') | Q(phone_number__isnull=True) | Q(phone_number='')
+        )
+
+    ids = list(orders.order_by().values_list('pk', flat=True))
+    if not ids:
+        return 0
+    return apply_transitions({state: ids})
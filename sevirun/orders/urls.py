@@ -3,8 +3,10 @@ from . import views
 
 urlpatterns = [
     path('', views.index_customer_orders, name = 'orders'),
+    path('transition/', views.transition_state, name = 'orders_transition'),
     path('sales', views.index_sales, name = 'sales'),
     path('detail/<int:order_id>/', views.order_detail, name='order_detail'),
     path('tracking/<str:tracking_number>/', views.order_tracking, name='order_tracking'),
+    path('sla/', views.order_sla, name = 'order_sla'),
     path('delivery_cost', views.delivery_cost, name='delivery_cost'),
 ]
\ No newline at end of file
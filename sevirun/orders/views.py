@@ -1,32 +1,87 @@
+from datetime import timedelta
 from django.shortcuts import redirect, render
+from django.utils import timezone
+from django.urls import reverse
+from django.views.decorators.http import require_POST
 from .models import *
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.http import HttpResponseForbidden
 from django.contrib import messages
+from products.pagination import is_fragment_request, keyset_paginate
+from .filters import filter_orders
+from .forms import OrderFiltersForm
+from .history import summarize_state_days
+from .transitions import parse_state_changes, transition_matching, transition_orders
 
 @staff_member_required(login_url='login')
 def index_sales(request):
-    sales = Order.objects.filter(state="DE").order_by('-created_at')
+    sales = Order.objects.filter(state="DE").select_related('client')\
+        .prefetch_related('items__product', 'items__size').order_by('-created_at')
     return render(request, 'orders/sales_list.html', { "sales" : sales })
 
+ORDER_SORT = ('-created_at', '-pk')
+
 @login_required(login_url='login')
 def index_customer_orders(request):
     prev_page = request.GET.get('from', '/')
+    filters = None
 
     if request.user.is_staff or request.user.is_superuser:
-        orders = Order.objects.all().order_by('-created_at')
-
         if request.method == 'POST':
-            for order in orders:
-                state = request.POST.get(f'order-{order.pk}-state', None)
+            change_states(request, parse_state_changes(request.POST))
 
-                if state != None:
-                    order.state = state.strip()
-                    order.save()
+        filters = OrderFiltersForm(request.GET)
+        orders = Order.objects.select_related('client')
+        if filters.is_valid():
+            orders = filter_orders(filters.cleaned_data, orders)
     else:
-        orders = Order.objects.filter(client=request.user).order_by('-created_at')
-    return render(request, 'orders/orders_list.html', { "orders" : orders, "states": OrderState.choices, 'from': prev_page })
+        orders = Order.objects.filter(client=request.user)
+
+    page = keyset_paginate(orders, ORDER_SORT, request.GET.get('cursor'))
+    context = {
+        "orders": page.items,
+        "next_page_url": page.next_url(request),
+        "states": OrderState.choices,
+        "filters": filters,
+        'from': prev_page,
+    }
+
+    if is_fragment_request(request):
+        return render(request, 'orders/orders_page.html', context)
+    return render(request, 'orders/orders_list.html', context)
+
+def change_states(request, changes):
+    updated, rejected = transition_orders(changes)
+
+    if rejected:
+        ids = ', '.join(f'#{pk}' for pk in rejected)
+        messages.error(request, f"No se puede cambiar el estado de los pedidos {ids}.")
+    return updated
+
+@staff_member_required(login_url='login')
+@require_POST
+def transition_state(request):
+    # Changes the state of the posted orders (order-<pk>-state fields) or, given target_state,
+    # of every order matching the filters of the query string
+    target = request.POST.get('target_state', '').strip()
+
+    if target:
+        filters = OrderFiltersForm(request.GET)
+        if target not in OrderState.values or not filters.is_valid():
+            messages.error(request, "El cambio de estado no es válido.")
+        elif not any(filters.cleaned_data.values()):
+            messages.error(request, "Seleccione algún filtro antes de cambiar el estado de los pedidos.")
+        else:
+            updated = transition_matching(filter_orders(filters.cleaned_data, Order.objects.all()), target)
+            messages.success(request, f"{updated} pedidos actualizados.")
+    else:
+        change_states(request, parse_state_changes(request.POST))
+
+    url = reverse('orders')
+    if request.GET:
+        url += '?' + request.GET.urlencode()
+    return redirect(url)
 
 @login_required(login_url='login')
 def order_detail(request, order_id):
@@ -44,8 +99,8 @@ def order_detail(request, order_id):
         state = request.POST.get(f'order-{order.pk}-state', None)
 
         if state != None:
-            order.state = state.strip()
-            order.save()
+            change_states(request, {order.pk: state.strip()})
+            order.refresh_from_db()
             
     order_items = OrderItem.objects.filter(order=order)
     return render(request, 'orders/order_detail.html', { "order": order, "order_items": order_items, "states": OrderState.choices })
@@ -60,6 +115,24 @@ def order_tracking(request, tracking_number):
     order_items = OrderItem.objects.filter(order=order)
     return render(request, 'orders/order_detail.html', { "order": order, "order_items": order_items, "states": OrderState.choices, 'is_tracking': True })
 
+SLA_PERIODS = (7, 30, 90)
+
+@staff_member_required(login_url='login')
+def order_sla(request):
+    # Time spent by the orders in each state, read from the daily rollup (rollup_order_states)
+    days = request.GET.get('days', '30')
+    days = int(days) if days.isdigit() and int(days) in SLA_PERIODS else 30
+    since = timezone.localdate() - timedelta(days=days - 1)
+
+    context = {
+        'summary': summarize_state_days(since),
+        'state_days': OrderStateDay.objects.filter(day__gte=since).order_by('-day', 'state'),
+        'days': days,
+        'periods': SLA_PERIODS,
+        'from': request.GET.get('from', '/'),
+    }
+    return render(request, 'orders/order_sla.html', context)
+
 @staff_member_required(login_url='login')
 def delivery_cost(request):
     if not request.user.is_staff:
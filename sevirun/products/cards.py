@@ -0,0 +1,54 @@
+from django.utils import timezone
+from .models import Product, ProductCard
+
+# SQLite limits the number of parameters per statement
+REFRESH_BATCH_SIZE = 500
+
+CARD_FIELDS = [
+    'name', 'brand_name', 'picture', 'price', 'price_on_sale', 'effective_price',
+    'is_highlighted', 'is_available', 'updated_at', 'stock_version',
+]
+
+def build_card(product, refreshed_at):
+    return ProductCard(
+        product_id=product.pk,
+        name=product.name,
+        brand_name=product.model.brand.name,
+        picture=product.picture.name,
+        price=product.price,
+        price_on_sale=product.price_on_sale,
+        effective_price=product.price_on_sale if product.price_on_sale != None else product.price,
+        is_highlighted=product.is_highlighted,
+        is_available=product.is_available,
+        updated_at=refreshed_at,
+        stock_version=product.stock_version,
+    )
+
+def refresh_product_cards(product_ids):
+    # Rebuilds (upserts) the cards of the given products from their current rows
+    product_ids = list(product_ids)
+
+    for i in range(0, len(product_ids), REFRESH_BATCH_SIZE):
+        products = Product.objects.filter(pk__in=product_ids[i:i + REFRESH_BATCH_SIZE])\
+            .select_related('model__brand')
+        ProductCard.objects.bulk_create(
+            [build_card(p, timezone.now()) for p in products],
+            update_conflicts=True,
+            unique_fields=['product'],
+            update_fields=CARD_FIELDS
+        )
+
+def rebuild_product_cards():
+    refresh_product_cards(Product.objects.values_list('pk', flat=True))
+
+def get_product_cards(products):
+    # Cards of the given products (only their pk is needed), in the same order. Cards that do
+    # not exist yet are built on the fly
+    product_ids = [p.pk for p in products]
+    cards = ProductCard.objects.in_bulk(product_ids)
+    missing = [pk for pk in product_ids if pk not in cards]
+
+    if missing:
+        refresh_product_cards(missing)
+        cards.update(ProductCard.objects.in_bulk(missing))
+    return [cards[pk] for pk in product_ids if pk in cards]
@@ -0,0 +1,107 @@
+import hashlib
+import time
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db.models import Count, Value
+from .models import Product, ProductStock
+
+CATALOG_VERSION_KEY = 'catalog_version'
+FACET_CACHE_TIMEOUT = 60 * 60
+
+# Facet name -> ProductStock lookup of the option a product is counted under
+FACETS = {
+    'size': 'size',
+    'colour': 'colour',
+    'brand': 'product__model__brand',
+    'type': 'product__type',
+    'material': 'product__material',
+    'season': 'product__season',
+}
+STOCK_FACETS = ('size', 'colour')
+
+def new_version():
+    # Seed of a version counter missing from the cache (culled or never set). It must not
+    # repeat an earlier version, or the entries cached under that version would be valid again
+    return time.time_ns()
+
+def get_catalog_version():
+    return cache.get_or_set(CATALOG_VERSION_KEY, new_version, timeout=None)
+
+def bump_catalog_version():
+    # Every cache key built from the version becomes unreachable and expires on its own
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.set(CATALOG_VERSION_KEY, new_version(), timeout=None)
+
+def stock_in_hand():
+    # Stock rows a size or colour counts for, both in the facet counts and in the size and
+    # colour filters of products.filters
+    return ProductStock.objects.filter(stock__gt=0)
+
+def count_facets():
+    # One UNION ALL of grouped counts: available (not deleted, stock > 0) products per option
+    stocks = stock_in_hand().filter(product__is_deleted=False)
+    queries = [
+        stocks.values(lookup)
+            .annotate(facet=Value(name), count=Count('product', distinct=True))
+            .values_list('facet', lookup, 'count')
+            .order_by()
+        for name, lookup in FACETS.items()
+    ]
+
+    counts = {name: {} for name in FACETS}
+    for name, pk, count in queries[0].union(*queries[1:], all=True):
+        counts[name][pk] = count
+    return counts
+
+def get_facet_counts():
+    # {facet: {option pk: available product count}}, options without products are missing
+    key = f'product_facets:{get_catalog_version()}'
+    counts = cache.get(key)
+
+    if counts is None:
+        counts = count_facets()
+        cache.set(key, counts, FACET_CACHE_TIMEOUT)
+    return counts
+
+def count_matching_facets(products):
+    # Same shape as count_facets but restricted to the products of a (filtered) queryset:
+    # size/colour count the products with stock of the option, the rest their own field
+    product_ids = products.order_by().values('pk')
+    queries = []
+
+    for name, lookup in FACETS.items():
+        if name in STOCK_FACETS:
+            rows = stock_in_hand().filter(product__in=product_ids)
+            field, counted = lookup, 'product'
+        else:
+            rows = Product.objects.filter(pk__in=product_ids)
+            field, counted = lookup.removeprefix('product__'), 'pk'
+
+        queries.append(
+            rows.values(field)
+                .annotate(facet=Value(name), count=Count(counted, distinct=True))
+                .values_list('facet', field, 'count')
+                .order_by()
+        )
+
+    counts = {name: {} for name in FACETS}
+    for name, pk, count in queries[0].union(*queries[1:], all=True):
+        counts[name][pk] = count
+    return counts
+
+def get_matching_facet_counts(products):
+    # Cached per catalog version and per filter state (the SQL of the queryset). Invalid filter
+    # values give products.none(), which has no SQL and nothing to count
+    try:
+        query = str(products.order_by().values('pk').query)
+    except EmptyResultSet:
+        return {name: {} for name in FACETS}
+    key = f'product_matching_facets:{get_catalog_version()}:{hashlib.md5(query.encode()).hexdigest()}'
+    counts = cache.get(key)
+
+    if counts is None:
+        counts = count_matching_facets(products)
+        cache.set(key, counts, FACET_CACHE_TIMEOUT)
+    return counts
@@ -0,0 +1,63 @@
+from django.db.models import Exists, OuterRef, Q
+from .catalog import stock_in_hand
+from .models import Product
+from .search import search_products, fuzzy_search_products
+
+# Parameters of ProductFiltersForm (plus model and the search box) that the catalog understands
+FK_FILTERS = {
+    'brand': 'model__brand',
+    'type': 'type',
+    'model': 'model',
+    'season': 'season',
+    'material': 'material',
+}
+STOCK_FILTERS = ('size', 'colour')
+IN_STOCK_PARAM = 'in_stock'
+SEARCH_PARAM = 'product-search'
+
+def get_filter_value(params, name):
+    value = params.get(name, None)
+
+    if value == None or value == 'null' or value == '':
+        return None
+    return value
+
+def filter_products(params, products=None, fuzzy=False):
+    # Compiles every filter into a single SQL statement: foreign key filters become
+    # plain WHERE clauses, size/colour become EXISTS subqueries over the stock in hand, in_stock
+    # reads the maintained total_stock column and the search text goes through the
+    # full-text index (or the trigram index if fuzzy)
+    if products is None:
+        products = Product.objects.filter(is_deleted=False)
+
+    conditions = Q()
+
+    for name, lookup in FK_FILTERS.items():
+        value = get_filter_value(params, name)
+
+        if value != None:
+            if not str(value).isdigit():
+                return products.none()
+            conditions &= Q(**{lookup: value})
+
+    for name in STOCK_FILTERS:
+        value = get_filter_value(params, name)
+
+        if value != None:
+            if not str(value).isdigit():
+                return products.none()
+            conditions &= Exists(stock_in_hand().filter(product=OuterRef('pk'), **{name: value}))
+
+    if get_filter_value(params, IN_STOCK_PARAM) in ('on', 'true', '1'):
+        conditions &= Q(total_stock__gt=0)
+
+    products = products.filter(conditions)
+    search_text = get_filter_value(params, SEARCH_PARAM)
+
+    if search_text != None:
+        if fuzzy:
+            products = fuzzy_search_products(products, search_text)
+        else:
+            products = search_products(products, search_text)
+
+    return products
@@ -1,5 +1,7 @@
 from django import forms
 from .models import *
+from .pagination import SORT_CHOICES
+from .catalog import get_catalog_version
 
 def get_brand_choices():
     out = [('null', 'Todas')]
@@ -31,6 +33,32 @@ def get_product_colour_choices():
     out.extend([(str(c.pk), c.name) for c in ProductColour.objects.all()])
     return out
 
+CHOICE_LOADERS = {
+    'brand': get_brand_choices,
+    'type': get_product_type_choices,
+    'season': get_product_season_choices,
+    'material': get_product_material_choices,
+    'size': get_product_size_choices,
+    'colour': get_product_colour_choices,
+}
+
+# Process level cache of the dropdown choices, valid while the catalog version does not change
+cached_choices = {'version': None, 'choices': {}}
+
+def get_cached_choices():
+    version = get_catalog_version()
+
+    if cached_choices['version'] != version:
+        cached_choices['choices'] = {name: loader() for name, loader in CHOICE_LOADERS.items()}
+        cached_choices['version'] = version
+    return cached_choices['choices']
+
+def with_counts(choices, counts):
+    return [
+        (value, label if value == 'null' else f'{label} ({counts.get(int(value), 0)})')
+        for value, label in choices
+    ]
+
 class ProductFiltersForm(forms.Form):
     brand = forms.ChoiceField(required = False, label = 'Marca', choices = get_brand_choices)    
     type = forms.ChoiceField(required = False, label = 'Tipo', choices = get_product_type_choices)
@@ -38,9 +66,16 @@ class ProductFiltersForm(forms.Form):
     material = forms.ChoiceField(required = False, label = 'Material', choices = get_product_material_choices)
     size = forms.ChoiceField(required = False, label = 'Talla', choices = get_product_size_choices)
     colour = forms.ChoiceField(required = False, label = 'Color', choices = get_product_colour_choices)
+    in_stock = forms.BooleanField(required = False, label = 'Solo con stock')
+    sort = forms.ChoiceField(required = False, label = 'Ordenar', choices = SORT_CHOICES)
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, counts=None, **kwargs):
+        # counts: {field: {option pk: matching products}} as returned by get_matching_facet_counts
         super().__init__(*args, **kwargs)
+
+        for name, choices in get_cached_choices().items():
+            self.fields[name].choices = choices if counts is None else with_counts(choices, counts[name])
         
         for field in self.fields:
             self.fields[field].widget.attrs['class'] = 'd-flex form-select'
+        self.fields['in_stock'].widget.attrs['class'] = 'form-check-input'
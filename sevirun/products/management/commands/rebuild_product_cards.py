@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from products.cards import rebuild_product_cards
+
+class Command(BaseCommand):
+    help = 'Rebuilds the product card read model used by the listing pages'
+
+    def handle(self, *args, **options):
+        rebuild_product_cards()
+        self.stdout.write(self.style.SUCCESS('Product cards rebuilt.'))
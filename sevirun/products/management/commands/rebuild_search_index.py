@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from products.search import rebuild_index, is_search_index_enabled
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text search index of the product catalog'
+
+    def handle(self, *args, **options):
+        if not is_search_index_enabled():
+            self.stdout.write(self.style.WARNING('The search index is only available on SQLite.'))
+            return
+
+        rebuild_index()
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt.'))
@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from products.stock import release_expired_reservations
+
+class Command(BaseCommand):
+    help = 'Releases the expired stock reservations of unpaid orders (meant to run periodically)'
+
+    def handle(self, *args, **options):
+        count = release_expired_reservations()
+        self.stdout.write(self.style.SUCCESS(f'{count} stock reservations released.'))
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:12
+
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS products_product_fts USING fts5(
+            name, short_description, model_name, brand_name,
+            tokenize = "unicode61 remove_diacritics 2"
+        )
+    ''')
+    schema_editor.execute('''
+        INSERT INTO products_product_fts (rowid, name, short_description, model_name, brand_name)
+        SELECT p.id, p.name, p.short_description, m.name, b.name
+        FROM products_product p
+            INNER JOIN products_productmodel m ON m.id = p.model_id
+            INNER JOIN products_brand b ON b.id = m.brand_id
+        WHERE p.is_deleted = 0
+    ''')
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS products_product_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0016_alter_product_material_alter_product_model_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
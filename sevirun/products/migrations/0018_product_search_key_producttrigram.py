@@ -0,0 +1,73 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:17
+
+import re
+import unicodedata
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(text.lower().split())
+
+
+def trigrams(text):
+    out = set()
+    # Same tokenization as products.search.get_trigrams
+    for word in re.findall(r'\w+', normalize(text)):
+        padded = f'  {word} '
+        out.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return out
+
+
+def populate_search_keys(apps, schema_editor):
+    ProductModel = apps.get_model('products', 'ProductModel')
+    Product = apps.get_model('products', 'Product')
+    ProductTrigram = apps.get_model('products', 'ProductTrigram')
+
+    for model in ProductModel.objects.all():
+        model.search_key = normalize(model.name)
+        model.save(update_fields=['search_key'])
+
+    rows = []
+    for product in Product.objects.select_related('model__brand'):
+        product.search_key = normalize(product.name)
+        product.save(update_fields=['search_key'])
+        if product.is_deleted:
+            continue
+        text = f'{product.search_key} {product.model.search_key} {normalize(product.model.brand.name)}'
+        rows.extend(ProductTrigram(product=product, trigram=t) for t in trigrams(text))
+    ProductTrigram.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0017_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='productmodel',
+            name='search_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=32),
+        ),
+        migrations.CreateModel(
+            name='ProductTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trigram', models.CharField(max_length=3)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trigrams', to='products.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['trigram', 'product'], name='product_trigram_idx')],
+            },
+        ),
+        migrations.RunPython(populate_search_keys, migrations.RunPython.noop),
+    ]
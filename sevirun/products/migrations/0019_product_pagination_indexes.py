@@ -0,0 +1,22 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:21
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0018_product_search_key_producttrigram'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['created_at', 'id'], name='product_created_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(django.db.models.functions.comparison.Coalesce('price_on_sale', 'price'), models.F('id'), name='product_effective_price_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:25
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_total_stock(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    ProductStock = apps.get_model('products', 'ProductStock')
+    totals = ProductStock.objects.filter(product=OuterRef('pk'))\
+        .values('product')\
+        .annotate(total=Sum('stock'))\
+        .values('total')
+    Product.objects.update(total_stock=Coalesce(Subquery(totals), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0019_product_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='total_stock',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_deleted', 'total_stock'], name='product_in_stock_idx'),
+        ),
+        migrations.RunPython(populate_total_stock, migrations.RunPython.noop),
+    ]
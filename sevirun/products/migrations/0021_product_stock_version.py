@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0020_product_total_stock'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='stock_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_product_cards(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    ProductCard = apps.get_model('products', 'ProductCard')
+    ProductCard.objects.bulk_create([
+        ProductCard(
+            product_id=p.pk,
+            name=p.name,
+            brand_name=p.model.brand.name,
+            picture=p.picture.name,
+            price=p.price,
+            price_on_sale=p.price_on_sale,
+            effective_price=p.price_on_sale if p.price_on_sale is not None else p.price,
+            is_highlighted=p.is_highlighted,
+            is_available=p.total_stock > 0,
+            updated_at=p.updated_at,
+            stock_version=p.stock_version,
+        )
+        for p in Product.objects.select_related('model__brand').iterator()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0021_product_stock_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductCard',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='card', serialize=False, to='products.product')),
+                ('name', models.CharField(max_length=255)),
+                ('brand_name', models.CharField(max_length=255)),
+                ('picture', models.ImageField(upload_to='products/')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=6)),
+                ('price_on_sale', models.DecimalField(decimal_places=2, max_digits=6, null=True)),
+                ('effective_price', models.DecimalField(decimal_places=2, max_digits=6)),
+                ('is_highlighted', models.BooleanField()),
+                ('is_available', models.BooleanField()),
+                ('updated_at', models.DateTimeField()),
+                ('stock_version', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(populate_product_cards, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,12 @@
+import unicodedata
 from django.db import models
+from django.db.models.functions import Coalesce
+
+def normalize_search_text(text):
+    # Lowercased, accent-folded and whitespace-collapsed text used by the search indexes
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(text.lower().split())
 
 # Brand
 class Brand(models.Model):
@@ -13,11 +21,16 @@ class ProductModel(models.Model):
     name = models.CharField(max_length = 32, null = False)
     picture = models.ImageField(upload_to = 'models/', null = True)
     brand = models.ForeignKey(Brand, on_delete = models.DO_NOTHING, null = False, related_name='models')
+    search_key = models.CharField(max_length = 32, null = False, blank = True, default = '', editable = False)
 
     @property
     def products(self):
         return Product.objects.filter(model=self, is_deleted=False)
 
+    def save(self, *args, **kwargs):
+        self.search_key = normalize_search_text(self.name)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f'{{name: {self.name}, brand: {self.brand.name}}}'
 
@@ -55,10 +68,8 @@ class ProductSize(models.Model):
 
     @property
     def product_count(self):
-        return self.productstock_set.filter(
-            stock__gt=0,
-            product__is_deleted=False
-        ).values('product').distinct().count()
+        from .catalog import get_facet_counts
+        return get_facet_counts()['size'].get(self.pk, 0)
 
     def __str__(self):
         return f'{{name: {self.name}}}'
@@ -69,14 +80,15 @@ class ProductColour(models.Model):
 
     @property
     def product_count(self):
-        return self.productstock_set.filter(
-            stock__gt=0,
-            product__is_deleted=False
-        ).values('product').distinct().count()
+        from .catalog import get_facet_counts
+        return get_facet_counts()['colour'].get(self.pk, 0)
 
     def __str__(self):
         return f'{{name: {self.name}}}'
 
+# Columns of Product maintained with queryset updates only
+STOCK_COLUMNS = ('total_stock', 'stock_version')
+
 # Product
 class Product(models.Model):
     name = models.CharField(max_length = 255, null = False, blank=False)
@@ -93,17 +105,42 @@ class Product(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     
     is_deleted = models.BooleanField(null = False, default=False)
+    search_key = models.CharField(max_length = 255, null = False, blank = True, default = '', editable = False)
+
+    # Sum of the ProductStock rows and a counter of their changes, kept in sync by
+    # products.stock.refresh_total_stock (and never written by save)
+    total_stock = models.PositiveIntegerField(null = False, default = 0, editable = False)
+    stock_version = models.PositiveIntegerField(null = False, default = 0, editable = False)
 
     # Navigation attributes
     model = models.ForeignKey(ProductModel, on_delete = models.DO_NOTHING, null = False)
     type = models.ForeignKey(ProductType, on_delete = models.DO_NOTHING, null = False)
     season = models.ForeignKey(ProductSeason, on_delete = models.CASCADE, null = False)
     material = models.ForeignKey(ProductMaterial, on_delete = models.DO_NOTHING, null = False)
+
+    class Meta:
+        # Keyset pagination orderings of the catalog
+        indexes = [
+            models.Index(fields = ['created_at', 'id'], name = 'product_created_at_idx'),
+            models.Index(Coalesce('price_on_sale', 'price'), 'id', name = 'product_effective_price_idx'),
+            models.Index(fields = ['is_deleted', 'total_stock'], name = 'product_in_stock_idx'),
+        ]
     
     @property
     def is_available(self):
-        stocks = ProductStock.objects.all().filter(product = self)
-        return (sum([s.stock for s in stocks]) > 0)
+        return self.total_stock > 0
+
+    def save(self, *args, **kwargs):
+        self.search_key = normalize_search_text(self.name)
+
+        # Updates never write the stock columns back: a stock change committed after the
+        # instance was loaded would be undone
+        if self.pk != None and not self._state.adding and kwargs.get('update_fields') == None:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in STOCK_COLUMNS
+            ]
+        super().save(*args, **kwargs)
     
     def __str__(self):
         return f'''
@@ -134,3 +171,56 @@ class ProductStock(models.Model):
 
     def __str__(self):
         return f'{{product: {self.product.name}, size: {self.size.name}, colour: {self.colour.name}, stock: {self.stock}}}'
+
+# Units of a stock row held by a pending order until it is paid or the reservation expires
+class StockReservation(models.Model):
+    stock = models.ForeignKey(ProductStock, on_delete = models.CASCADE, null = False, related_name = 'reservations')
+    order = models.ForeignKey('orders.Order', on_delete = models.CASCADE, null = False, related_name = 'reservations')
+    quantity = models.PositiveIntegerField(null = False)
+    expires_at = models.DateTimeField(null = False)
+
+    class Meta:
+        # Active reservations of a stock row are a range of the first index, and the expired
+        # ones a range of the second
+        indexes = [
+            models.Index(fields = ['stock', 'expires_at'], name = 'reservation_stock_idx'),
+            models.Index(fields = ['expires_at'], name = 'reservation_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f'{{stock: {self.stock_id}, order: {self.order_id}, quantity: {self.quantity}, expires_at: {self.expires_at}}}'
+
+# Denormalized projection of a product for the listing cards, kept in sync by products.cards
+class ProductCard(models.Model):
+    product = models.OneToOneField(Product, on_delete = models.CASCADE, primary_key = True, related_name = 'card')
+    name = models.CharField(max_length = 255, null = False)
+    brand_name = models.CharField(max_length = 255, null = False)
+    picture = models.ImageField(upload_to = 'products/', null = False)
+
+    price = models.DecimalField(max_digits = 6, decimal_places = 2, null = False)
+    price_on_sale = models.DecimalField(max_digits = 6, decimal_places = 2, null = True)
+    effective_price = models.DecimalField(max_digits = 6, decimal_places = 2, null = False)
+
+    is_highlighted = models.BooleanField(null = False)
+    is_available = models.BooleanField(null = False)
+
+    # Last refresh of the card (it also follows model and brand edits), part of the key of
+    # its cached template fragment together with the stock version
+    updated_at = models.DateTimeField(null = False)
+    stock_version = models.PositiveIntegerField(null = False, default = 0)
+
+    def __str__(self):
+        return f'{{product: {self.product_id}, name: {self.name}, brand: {self.brand_name}}}'
+
+# Trigrams of the normalized product, model and brand names, used for fuzzy search
+class ProductTrigram(models.Model):
+    trigram = models.CharField(max_length = 3, null = False)
+    product = models.ForeignKey(Product, on_delete = models.CASCADE, null = False, related_name = 'trigrams')
+
+    class Meta:
+        indexes = [
+            models.Index(fields = ['trigram', 'product'], name = 'product_trigram_idx')
+        ]
+
+    def __str__(self):
+        return f'{{product: {self.product.pk}, trigram: {self.trigram}}}'
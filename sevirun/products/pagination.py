@@ -0,0 +1,109 @@
+import base64
+import datetime
+import json
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.db.models.functions import Coalesce
+
+PAGE_SIZE = 24
+
+# Every ordering ends with the primary key so the keyset is unique and stable
+SORT_ORDERS = {
+    'newest': ('-created_at', '-pk'),
+    'price_asc': ('effective_price', 'pk'),
+    'price_desc': ('-effective_price', '-pk'),
+    'relevance': ('search_rank', 'pk'),
+}
+SORT_CHOICES = [
+    ('newest', 'Más recientes'),
+    ('price_asc', 'Precio: menor a mayor'),
+    ('price_desc', 'Precio: mayor a menor'),
+]
+
+class KeysetPage:
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor != None
+
+    def next_url(self, request):
+        if not self.has_next:
+            return None
+        params = request.GET.copy()
+        params['cursor'] = self.next_cursor
+        return f'{request.path}?{params.urlencode()}'
+
+def sort_products(products, sort, searching=False):
+    # Returns the queryset and the keyset ordering for the requested sort. Searches that end
+    # early with products.none() (no words, invalid filters) have no search_rank to sort by
+    searching = searching and 'search_rank' in products.query.annotations
+    if sort not in SORT_ORDERS or (sort == 'relevance' and not searching):
+        sort = 'relevance' if searching else 'newest'
+
+    products = products.annotate(effective_price=Coalesce('price_on_sale', 'price'))
+    return products, SORT_ORDERS[sort]
+
+class CursorEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder cuts datetimes to milliseconds, which would skip the rows sharing the
+    # millisecond of the page boundary
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+def encode_cursor(values):
+    data = json.dumps(values, cls=CursorEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (ValueError, UnicodeError):
+        return None
+    return values if isinstance(values, list) else None
+
+def get_output_field(queryset, name):
+    if name == 'pk':
+        return queryset.model._meta.pk
+    try:
+        return queryset.model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return queryset.query.annotations[name].output_field
+
+def keyset_paginate(queryset, ordering, cursor=None, page_size=PAGE_SIZE):
+    # Seeks past the last row of the previous page instead of using OFFSET, so every page
+    # costs the same whatever its position and rows inserted meanwhile do not shift pages
+    fields = [(o.lstrip('-'), o.startswith('-')) for o in ordering]
+    queryset = queryset.order_by(*ordering)
+    values = decode_cursor(cursor) if cursor else None
+
+    if values != None and len(values) == len(fields):
+        try:
+            values = [get_output_field(queryset, name).to_python(v) for (name, _), v in zip(fields, values)]
+        except ValidationError:
+            values = None
+
+        if values != None:
+            after = Q()
+            for i, (name, descending) in enumerate(fields):
+                condition = Q(**{f'{name}__lt' if descending else f'{name}__gt': values[i]})
+                for j in range(i):
+                    condition &= Q(**{fields[j][0]: values[j]})
+                after |= condition
+            queryset = queryset.filter(after)
+
+    items = list(queryset[:page_size + 1])
+    next_cursor = None
+
+    if len(items) > page_size:
+        items = items[:page_size]
+        next_cursor = encode_cursor([getattr(items[-1], name) for name, _ in fields])
+
+    return KeysetPage(items, next_cursor)
+
+def is_fragment_request(request):
+    return request.headers.get('x-requested-with') == 'XMLHttpRequest'
@@ -0,0 +1,150 @@
+import math
+import re
+from django.db import connection
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from .models import Product, ProductTrigram, normalize_search_text
+
+# SQLite FTS5 index over the searchable text of every non deleted product (rowid = product id)
+FTS_TABLE = 'products_product_fts'
+
+# bm25 weights for name, short_description, model_name and brand_name
+FTS_WEIGHTS = (10.0, 1.0, 5.0, 3.0)
+
+# Minimum share of the query trigrams a product must contain to be a fuzzy match
+MIN_TRIGRAM_SIMILARITY = 0.4
+
+# SQLite limits the number of parameters per statement
+REINDEX_BATCH_SIZE = 500
+
+def is_search_index_enabled():
+    return connection.vendor == 'sqlite'
+
+def build_match_query(text):
+    # Every word becomes a quoted prefix query so user input never reaches the FTS5 syntax
+    words = re.findall(r'\w+', normalize_search_text(text))
+    return ' '.join(f'"{w}"*' for w in words)
+
+def get_trigrams(text):
+    trigrams = set()
+    for word in re.findall(r'\w+', normalize_search_text(text)):
+        padded = f'  {word} '
+        trigrams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return trigrams
+
+def trigram_similarity(a, b):
+    a, b = get_trigrams(a), get_trigrams(b)
+    if not a or not b:
+        return 0
+    return len(a & b) / len(a | b)
+
+def reindex_products(products):
+    # Rebuilds the full-text and trigram rows of the given products
+    product_ids = list(products.values_list('pk', flat=True))
+
+    for i in range(0, len(product_ids), REINDEX_BATCH_SIZE):
+        batch = product_ids[i:i + REINDEX_BATCH_SIZE]
+        reindex_fts(batch)
+        reindex_trigrams(batch)
+
+def reindex_fts(product_ids):
+    if not is_search_index_enabled() or not product_ids:
+        return
+
+    placeholders = ', '.join(['%s'] * len(product_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', product_ids)
+        cursor.execute(f'''
+            INSERT INTO {FTS_TABLE} (rowid, name, short_description, model_name, brand_name)
+            SELECT p.id, p.name, p.short_description, m.name, b.name
+            FROM products_product p
+                INNER JOIN products_productmodel m ON m.id = p.model_id
+                INNER JOIN products_brand b ON b.id = m.brand_id
+            WHERE p.is_deleted = 0 AND p.id IN ({placeholders})
+        ''', product_ids)
+
+def reindex_trigrams(product_ids):
+    ProductTrigram.objects.filter(product_id__in=product_ids).delete()
+
+    rows = []
+    products = Product.objects.filter(pk__in=product_ids, is_deleted=False)\
+        .values_list('pk', 'search_key', 'model__search_key', 'model__brand__name')
+
+    for pk, search_key, model_key, brand_name in products:
+        text = f'{search_key} {model_key} {brand_name}'
+        rows.extend(ProductTrigram(product_id=pk, trigram=t) for t in get_trigrams(text))
+    ProductTrigram.objects.bulk_create(rows, batch_size=REINDEX_BATCH_SIZE)
+
+def index_product(product):
+    # Also drops the rows of deleted products, since only non deleted ones are inserted back
+    reindex_fts([product.pk])
+    reindex_trigrams([product.pk])
+
+def index_model_products(model):
+    reindex_products(Product.objects.filter(model=model))
+
+def index_brand_products(brand):
+    reindex_products(Product.objects.filter(model__brand=brand))
+
+def rebuild_index():
+    if is_search_index_enabled():
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+    ProductTrigram.objects.all().delete()
+    reindex_products(Product.objects.filter(is_deleted=False))
+
+def search_products(products, text):
+    # Filters the queryset with the full-text index and annotates search_rank (lower is better)
+    if not is_search_index_enabled():
+        # Without the index every match ranks the same, so relevance falls back to the pk
+        key = normalize_search_text(text)
+        return products.filter(Q(search_key__contains=key) | Q(model__search_key__contains=key))\
+            .annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+    match = build_match_query(text)
+    if not match:
+        return products.none()
+
+    weights = ', '.join(str(w) for w in FTS_WEIGHTS)
+    return products.filter(
+        pk__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match])
+    ).annotate(
+        search_rank=RawSQL(
+            f'''SELECT bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE}
+                WHERE {FTS_TABLE} MATCH %s AND rowid = products_product.id''',
+            [match],
+            output_field=FloatField()
+        )
+    ).order_by('search_rank', 'pk')
+
+def fuzzy_search_products(products, text):
+    # Typo tolerant search: ranks products by the number of trigrams they share with the text
+    trigrams = sorted(get_trigrams(text))
+    if not trigrams:
+        return products.none()
+
+    min_shared = max(1, math.ceil(len(trigrams) * MIN_TRIGRAM_SIMILARITY))
+    placeholders = ', '.join(['%s'] * len(trigrams))
+
+    return products.filter(
+        pk__in=RawSQL(f'''
+            SELECT product_id FROM products_producttrigram
+            WHERE trigram IN ({placeholders})
+            GROUP BY product_id HAVING COUNT(DISTINCT trigram) >= %s
+        ''', trigrams + [min_shared])
+    ).annotate(
+        search_rank=RawSQL(f'''
+            SELECT -COUNT(DISTINCT t.trigram) FROM products_producttrigram t
+            WHERE t.product_id = products_product.id AND t.trigram IN ({placeholders})
+        ''', trigrams, output_field=FloatField())
+    ).order_by('search_rank', 'pk')
+
+def suggest_query(text, product):
+    # "Did you mean": replaces every word of text by the closest word of the product names
+    candidates = f'{product.search_key} {product.model.search_key} {normalize_search_text(product.model.brand.name)}'.split()
+    suggestion = []
+
+    for word in normalize_search_text(text).split():
+        best = max(candidates, key=lambda c: trigram_similarity(word, c))
+        suggestion.append(best if trigram_similarity(word, best) >= MIN_TRIGRAM_SIMILARITY else word)
+    return ' '.join(suggestion)
@@ -0,0 +1,67 @@
+from django.db.models import QuerySet
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import *
+from . import search
+from .cards import refresh_product_cards
+from .catalog import bump_catalog_version
+from .stock import refresh_total_stock
+
+# Keep the product search index in sync with the catalog
+
+@receiver(post_save, sender=Product)
+def index_saved_product(sender, instance, **kwargs):
+    search.index_product(instance)
+
+@receiver(post_delete, sender=Product)
+def remove_deleted_product(sender, instance, **kwargs):
+    search.index_product(instance)
+
+@receiver(post_save, sender=ProductModel)
+def index_model_products(sender, instance, **kwargs):
+    search.index_model_products(instance)
+
+@receiver(post_save, sender=Brand)
+def index_brand_products(sender, instance, **kwargs):
+    search.index_brand_products(instance)
+
+# Keep Product.total_stock and the product cards in sync with the catalog
+
+def is_product_deletion(origin):
+    # Rows deleted in cascade with their product must not rebuild anything for it
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return model is Product
+
+@receiver(post_save, sender=ProductStock)
+@receiver(post_delete, sender=ProductStock)
+def refresh_product_total_stock(sender, instance, origin=None, **kwargs):
+    if origin != None and is_product_deletion(origin):
+        return
+    refresh_total_stock([instance.product_id])
+    refresh_product_cards([instance.product_id])
+
+@receiver(post_save, sender=Product)
+def refresh_saved_product_card(sender, instance, **kwargs):
+    refresh_product_cards([instance.pk])
+
+@receiver(post_save, sender=ProductModel)
+def refresh_model_product_cards(sender, instance, **kwargs):
+    refresh_product_cards(Product.objects.filter(model=instance).values_list('pk', flat=True))
+
+@receiver(post_save, sender=Brand)
+def refresh_brand_product_cards(sender, instance, **kwargs):
+    refresh_product_cards(Product.objects.filter(model__brand=instance).values_list('pk', flat=True))
+
+# Invalidate everything cached for the current catalog version
+
+CATALOG_MODELS = (
+    Brand, ProductModel, ProductType, ProductSeason, ProductMaterial,
+    ProductSize, ProductColour, Product, ProductStock,
+)
+
+def invalidate_catalog(sender, **kwargs):
+    bump_catalog_version()
+
+for model in CATALOG_MODELS:
+    post_save.connect(invalidate_catalog, sender=model, dispatch_uid=f'invalidate_catalog_{model.__name__}')
+    post_delete.connect(invalidate_catalog, sender=model, dispatch_uid=f'invalidate_catalog_{model.__name__}')
@@ -0,0 +1,193 @@
+from datetime import timedelta
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, Now
+from django.utils import timezone
+from .cards import refresh_product_cards
+from .catalog import bump_catalog_version, new_version
+from .models import Product, ProductStock, StockReservation
+
+STOCK_VERSION_KEY = 'stock_version'
+
+# Time a pending order holds its units before they are available again
+RESERVATION_TTL = timedelta(minutes = 15)
+
+def get_stock_version():
+    return cache.get_or_set(STOCK_VERSION_KEY, new_version, timeout=None)
+
+def bump_stock_version():
+    try:
+        cache.incr(STOCK_VERSION_KEY)
+    except ValueError:
+        cache.set(STOCK_VERSION_KEY, new_version(), timeout=None)
+
+def refresh_total_stock(product_ids):
+    # Recomputes the denormalized Product.total_stock from the ProductStock rows in one UPDATE.
+    # A stock change is a change of the product page, so it also moves updated_at, and of the
+    # facet counts (QuerySet.update sends no signal to invalidate them)
+    totals = ProductStock.objects.filter(product=OuterRef('pk'))\
+        .values('product')\
+        .annotate(total=Sum('stock'))\
+        .values('total')
+
+    Product.objects.filter(pk__in=product_ids).update(
+        total_stock=Coalesce(Subquery(totals), Value(0)),
+        stock_version=F('stock_version') + 1,
+        updated_at=Now()
+    )
+    bump_stock_version()
+    bump_catalog_version()
+
+def touch_stock(product_ids):
+    # Availability changes without a change of the stock rows (reservations)
+    Product.objects.filter(pk__in=product_ids).update(stock_version=F('stock_version') + 1, updated_at=Now())
+    bump_stock_version()
+
+def reserved_quantity(exclude_order=None):
+    # Units of the stock row (the outer query) held by the active reservations of other orders
+    reservations = StockReservation.objects.filter(stock=OuterRef('pk'), expires_at__gt=timezone.now())
+    if exclude_order != None:
+        reservations = reservations.exclude(order=exclude_order)
+    total = reservations.values('stock').annotate(total=Sum('quantity')).values('total')
+    return Coalesce(Subquery(total), Value(0))
+
+def with_available_stock(stocks, exclude_order=None):
+    return stocks.annotate(available=Greatest(F('stock') - reserved_quantity(exclude_order), Value(0)))
+
+def get_stock_key(line):
+    return (line.product_id, line.size_id, line.colour_id)
+
+def group_stock_lines(lines):
+    # Lines are objects with product_id, size_id, colour_id and quantity (order or cart items)
+    quantities = {}
+    for line in lines:
+        quantities[get_stock_key(line)] = quantities.get(get_stock_key(line), 0) + line.quantity
+    return quantities
+
+def get_line_stocks(quantities):
+    # Stock rows of the grouped lines (the IN filters may match a few more, which are skipped)
+    return ProductStock.objects.filter(
+        product__in={p for p, _, _ in quantities},
+        size__in={s for _, s, _ in quantities},
+        colour__in={c for _, _, c in quantities},
+    )
+
+def get_short_lines(lines, order=None):
+    # Lines whose available stock (not counting the reservations of the order) does not cover
+    # their quantity, read in one query
+    lines = list(lines)
+    quantities = group_stock_lines(lines)
+    if not quantities:
+        return []
+
+    stocks = with_available_stock(get_line_stocks(quantities), exclude_order=order)\
+        .values_list('product_id', 'size_id', 'colour_id', 'available')
+    available = {(p, s, c): stock for p, s, c, stock in stocks}
+
+    return [l for l in lines if available.get(get_stock_key(l), 0) < quantities[get_stock_key(l)]]
+
+def decrement_stock(lines, clamp=False, order=None):
+    # Takes the quantities of the lines with one conditional UPDATE per product, size and colour,
+    # so concurrent payments can never take the same units, nor the ones reserved by other
+    # orders. The reservations of the order become the decrement. Short lines are left untouched
+    # (or set to 0 with clamp) and returned, and the caller decides whether to roll back.
+    # Updates skip the ProductStock signals, so the totals and cards are refreshed here once
+    lines = list(lines)
+    quantities = group_stock_lines(lines)
+    short = set()
+
+    with transaction.atomic():
+        for (product_id, size_id, colour_id), quantity in quantities.items():
+            stock = ProductStock.objects.filter(product_id=product_id, size_id=size_id, colour_id=colour_id)
+            available = stock.filter(stock__gte=Value(quantity) + reserved_quantity(exclude_order=order))
+            if not available.update(stock=F('stock') - quantity):
+                short.add((product_id, size_id, colour_id))
+                if clamp:
+                    stock.update(stock=Greatest(F('stock') - quantity, Value(0)))
+
+        if order != None:
+            order.reservations.all().delete()
+
+        product_ids = {p for p, _, _ in quantities}
+        if product_ids:
+            refresh_total_stock(product_ids)
+            refresh_product_cards(product_ids)
+
+    return [l for l in lines if get_stock_key(l) in short]
+
+def reserve_stock(order, lines):
+    # Holds the units of the lines for the order during RESERVATION_TTL, as long as the stock
+    # not reserved by other orders covers them. Short lines are not reserved and are returned,
+    # and the caller decides whether to roll back
+    lines = list(lines)
+    quantities = group_stock_lines(lines)
+    if not quantities:
+        return []
+
+    expires_at = timezone.now() + RESERVATION_TTL
+    with transaction.atomic():
+        stocks = with_available_stock(get_line_stocks(quantities).select_for_update(), exclude_order=order)\
+            .values_list('pk', 'product_id', 'size_id', 'colour_id', 'available')
+        available = {(p, s, c): (pk, stock) for pk, p, s, c, stock in stocks}
+        short = {key for key, quantity in quantities.items() if available.get(key, (None, 0))[1] < quantity}
+
+        StockReservation.objects.bulk_create([
+            StockReservation(stock_id=available[key][0], order=order, quantity=quantity, expires_at=expires_at)
+            for key, quantity in quantities.items()
+            if key not in short
+        ])
+        touch_stock({p for p, _, _ in quantities})
+
+    return [l for l in lines if get_stock_key(l) in short]
+
+def release_expired_reservations(now=None):
+    # Deletes every expired reservation with one DELETE, returns how many there were
+    expired = StockReservation.objects.filter(expires_at__lte=now or timezone.now())
+    product_ids = set(expired.values_list('stock__product_id', flat=True))
+    if not product_ids:
+        return 0
+
+    count, _ = expired.delete()
+    touch_stock(product_ids)
+    return count
+
+def release_order_reservations(order_ids):
+    # Drops the reservations of the given orders (cancelled ones), returns how many there were
+    reservations = StockReservation.objects.filter(order__in=order_ids)
+    product_ids = set(reservations.values_list('stock__product_id', flat=True))
+    if not product_ids:
+        return 0
+
+    count, _ = reservations.delete()
+    touch_stock(product_ids)
+    return count
+
+def summarize_stock(stocks):
+    # Derives everything the product page needs from its ProductStock rows (with size and
+    # colour selected and the available annotation): per size and per colour totals, the raw
+    # list and a size x colour matrix
+    sizes, colours, stock_list = {}, {}, []
+
+    for s in stocks:
+        size = sizes.setdefault(s.size_id, {'size__id': s.size_id, 'size__name': s.size.name, 'total': 0})
+        size['total'] += s.available
+        colour = colours.setdefault(s.colour_id, {'colour__id': s.colour_id, 'colour__name': s.colour.name, 'total': 0})
+        colour['total'] += s.available
+        stock_list.append({'size_id': s.size_id, 'colour_id': s.colour_id, 'stock': s.available})
+
+    sizes = sorted(sizes.values(), key=lambda s: s['size__name'])
+    colours = sorted(colours.values(), key=lambda c: c['colour__name'])
+
+    matrix = {
+        'sizes': [s['size__id'] for s in sizes],
+        'colours': [c['colour__id'] for c in colours],
+        'stock': [[0] * len(colours) for _ in sizes],
+    }
+    size_index = {pk: i for i, pk in enumerate(matrix['sizes'])}
+    colour_index = {pk: i for i, pk in enumerate(matrix['colours'])}
+
+    for s in stock_list:
+        matrix['stock'][size_index[s['size_id']]][colour_index[s['colour_id']]] += s['stock']
+
+    return sizes, colours, stock_list, matrix
@@ -29,6 +29,25 @@ def sample_product_attributes():
     material = ProductMaterial.objects.create(name = 'Leather')
     return [product_model, product_type, season, material]
 
+@pytest.fixture
+def create_product(sample_product_attributes):
+    def _create(name, short_description = 'Short desc', price = '19.99', price_on_sale = None):
+        [product_model, product_type, season, material] = sample_product_attributes
+        return Product.objects.create(
+            name = name,
+            short_description = short_description,
+            description = 'Long description',
+            picture = 'products/dummy.png',
+            price = price,
+            price_on_sale = price_on_sale,
+            is_highlighted = False,
+            model = product_model,
+            type = product_type,
+            season = season,
+            material = material,
+        )
+    return _create
+
 @pytest.fixture
 def sample_product(test_product_image, remove_image, sample_product_attributes):
     [product_model, product_type, season, material] = sample_product_attributes
@@ -0,0 +1,95 @@
+import pytest
+from django.core.cache import caches
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from products.models import *
+from products.test_fixtures import *
+from users.test_fixtures import *
+
+@pytest.mark.django_db
+def test_product_card_follows_product_brand_and_stock(create_product, sample_product_attributes):
+    product = create_product('Runner', price = '50.00', price_on_sale = '30.00')
+    card = ProductCard.objects.get(product = product)
+
+    assert (card.name == 'Runner')
+    assert (card.brand_name == 'Test Brand')
+    assert (str(card.effective_price) == '30.00')
+    assert (not card.is_available)
+
+    brand = sample_product_attributes[0].brand
+    brand.name = 'Nike'
+    brand.save()
+
+    stock = ProductStock.objects.create(
+        product = product,
+        size = ProductSize.objects.create(name = '42'),
+        colour = ProductColour.objects.create(name = 'Red'),
+        stock = 3
+    )
+    card.refresh_from_db()
+
+    assert (card.brand_name == 'Nike')
+    assert (card.is_available)
+
+    stock.delete()
+    card.refresh_from_db()
+
+    assert (not card.is_available)
+
+@pytest.mark.django_db
+def test_product_card_is_deleted_with_its_product(create_product):
+    product = create_product('Runner')
+    ProductStock.objects.create(
+        product = product,
+        size = ProductSize.objects.create(name = '42'),
+        colour = ProductColour.objects.create(name = 'Red'),
+        stock = 3
+    )
+
+    product.delete()
+
+    assert (not ProductCard.objects.exists())
+
+@pytest.mark.django_db
+def test_products_list_renders_cards_without_joins(client, create_product):
+    for i in range(5):
+        create_product(f'Runner {i}')
+
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(reverse('products'), headers = {'X-Requested-With': 'XMLHttpRequest'})
+
+    assert (response.status_code == 200)
+    assert (b'Test Brand' in response.content)
+    assert (len(queries.captured_queries) == 2)
+    assert (not any('JOIN' in q['sql'] for q in queries.captured_queries))
+
+@pytest.mark.django_db
+def test_product_card_fragment_is_cached_until_edited(client, create_product):
+    product = create_product('Runner')
+    url = reverse('products')
+    headers = {'X-Requested-With': 'XMLHttpRequest'}
+
+    client.get(url, headers = headers)
+    assert (len(caches['fragments']._cache) == 1)
+
+    response = client.get(url, headers = headers)
+    assert (b'Runner' in response.content)
+
+    product.name = 'Sprinter'
+    product.save()
+    response = client.get(url, headers = headers)
+
+    assert (b'Sprinter' in response.content)
+    assert (b'Runner' not in response.content)
+
+@pytest.mark.django_db
+def test_product_card_fragment_varies_for_staff(client, staff_user, create_product):
+    create_product('Runner')
+
+    response = client.get(reverse('products'), headers = {'X-Requested-With': 'XMLHttpRequest'})
+    assert ('Editar'.encode() not in response.content)
+
+    client.force_login(staff_user)
+    response = client.get(reverse('products'), headers = {'X-Requested-With': 'XMLHttpRequest'})
+    assert ('Editar'.encode() in response.content)
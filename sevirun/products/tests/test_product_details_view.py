@@ -4,6 +4,7 @@ from django.core.files.uploadedfile import SimpleUploadedFile
 from django.utils import timezone
 from pathlib import Path
 
+from products.test_fixtures import *
 from products.models import (
     Product,
     ProductMaterial,
@@ -204,3 +205,43 @@ def test_unavailable_product_display(client):
     content = response.content.decode()
 
     assert 'No disponible' in content
+
+@pytest.fixture
+def stocked_product(create_product):
+    product = create_product('Runner')
+    size = ProductSize.objects.create(name='38')
+    red = ProductColour.objects.create(name='Red')
+    blue = ProductColour.objects.create(name='Blue')
+    ProductStock.objects.create(product=product, size=size, colour=red, stock=2)
+    ProductStock.objects.create(product=product, size=size, colour=blue, stock=0)
+    return product
+
+@pytest.mark.django_db
+def test_product_detail_queries_and_stock_matrix(client, stocked_product, django_assert_num_queries):
+    url = reverse('product_detail', args=[stocked_product.id])
+
+    with django_assert_num_queries(2):
+        response = client.get(url)
+
+    matrix = response.context['stock_matrix']
+    assert len(matrix['sizes']) == 1
+    assert len(matrix['colours']) == 2
+    assert matrix['stock'] == [[0, 2]]
+    assert response.context['product_available']
+
+@pytest.mark.django_db
+def test_product_detail_not_modified(client, stocked_product, django_assert_num_queries):
+    url = reverse('product_detail', args=[stocked_product.id])
+    etag = client.get(url)['ETag']
+
+    with django_assert_num_queries(1):
+        response = client.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+
+    stock = ProductStock.objects.filter(product=stocked_product).first()
+    stock.stock = 7
+    stock.save()
+
+    response = client.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response['ETag'] != etag
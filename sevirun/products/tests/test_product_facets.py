@@ -0,0 +1,128 @@
+import pytest
+from products.models import *
+from django.urls import reverse
+from django.core.cache import cache
+from products.catalog import CATALOG_VERSION_KEY, bump_catalog_version, get_catalog_version, get_facet_counts
+from products.stock import STOCK_VERSION_KEY, bump_stock_version, get_stock_version
+from products.filters import filter_products
+from products.forms import ProductFiltersForm
+from products.stock import decrement_stock
+from types import SimpleNamespace as StockLine
+from products.test_fixtures import *
+
+@pytest.fixture
+def stocked_products(create_product, sample_product_attributes):
+    size = ProductSize.objects.create(name = '42')
+    red = ProductColour.objects.create(name = 'Red')
+    blue = ProductColour.objects.create(name = 'Blue')
+
+    runner = create_product('Runner')
+    sprinter = create_product('Sprinter')
+    ProductStock.objects.create(product = runner, size = size, colour = red, stock = 2)
+    ProductStock.objects.create(product = runner, size = size, colour = blue, stock = 1)
+    ProductStock.objects.create(product = sprinter, size = size, colour = blue, stock = 0)
+    return [runner, sprinter, size, red, blue]
+
+@pytest.mark.django_db
+def test_facet_counts_in_one_query(stocked_products, sample_product_attributes, django_assert_num_queries):
+    [runner, sprinter, size, red, blue] = stocked_products
+    [product_model, product_type, season, material] = sample_product_attributes
+
+    with django_assert_num_queries(1):
+        counts = get_facet_counts()
+
+    assert (counts['size'] == {size.pk: 1})
+    assert (counts['colour'] == {red.pk: 1, blue.pk: 1})
+    assert (counts['brand'] == {product_model.brand.pk: 1})
+    assert (counts['type'] == {product_type.pk: 1})
+    assert (counts['material'] == {material.pk: 1})
+    assert (counts['season'] == {season.pk: 1})
+
+    with django_assert_num_queries(0):
+        assert (size.product_count == 1)
+
+@pytest.mark.django_db
+def test_facet_counts_follow_catalog_writes(stocked_products):
+    [runner, sprinter, size, red, blue] = stocked_products
+    assert (get_facet_counts()['size'] == {size.pk: 1})
+
+    stock = ProductStock.objects.get(product = sprinter)
+    stock.stock = 5
+    stock.save()
+    assert (get_facet_counts()['size'] == {size.pk: 2})
+
+    runner.is_deleted = True
+    runner.save()
+    assert (get_facet_counts()['colour'] == {blue.pk: 1})
+
+@pytest.mark.django_db
+def test_facet_counts_follow_stock_decrements(stocked_products):
+    [runner, sprinter, size, red, blue] = stocked_products
+    assert (blue.product_count == 1)
+
+    decrement_stock([StockLine(product_id = runner.pk, size_id = size.pk, colour_id = blue.pk, quantity = 1)])
+    assert (blue.product_count == 0)
+    assert (red.product_count == 1)
+
+@pytest.mark.django_db
+def test_stock_filters_match_facet_counts(stocked_products):
+    [runner, sprinter, size, red, blue] = stocked_products
+    ProductStock.objects.filter(product = runner, colour = blue).update(stock = 0)
+
+    assert (list(filter_products({'colour': blue.pk})) == [])
+    assert (list(filter_products({'size': size.pk})) == [runner])
+    assert (get_facet_counts()['colour'] == {red.pk: 1})
+
+@pytest.mark.django_db
+def test_filters_form_choices_are_cached_until_catalog_changes(stocked_products, django_assert_num_queries):
+    ProductFiltersForm()
+
+    with django_assert_num_queries(0):
+        form = ProductFiltersForm()
+    assert (('null', 'Todas') in form.fields['brand'].choices)
+
+    brand = Brand.objects.create(name = 'Nike')
+    form = ProductFiltersForm()
+
+    assert ((str(brand.pk), 'Nike') in form.fields['brand'].choices)
+
+@pytest.mark.django_db
+def test_products_view_shows_counts_for_current_filters(client, stocked_products, sample_product_attributes):
+    [runner, sprinter, size, red, blue] = stocked_products
+    product_model = sample_product_attributes[0]
+
+    response = client.get(reverse('products') + f'?colour={red.pk}')
+    form = response.context['filters']
+
+    assert ((str(product_model.brand.pk), 'Test Brand (1)') in form.fields['brand'].choices)
+    assert ((str(blue.pk), 'Blue (1)') in form.fields['colour'].choices)
+
+    response = client.get(reverse('products'))
+    form = response.context['filters']
+
+    assert ((str(product_model.brand.pk), 'Test Brand (2)') in form.fields['brand'].choices)
+
+@pytest.mark.django_db
+def test_products_view_with_invalid_filter_values(client, stocked_products):
+    for params in ({'size': 'abc'}, {'brand': 'x'}):
+        response = client.get(reverse('products'), params)
+
+        assert (response.status_code == 200)
+        assert (list(response.context['products']) == [])
+
+@pytest.mark.django_db
+def test_versions_do_not_repeat_after_eviction():
+    for key, get_version, bump_version in (
+        (CATALOG_VERSION_KEY, get_catalog_version, bump_catalog_version),
+        (STOCK_VERSION_KEY, get_stock_version, bump_stock_version),
+    ):
+        bump_version()
+        seen = get_version()
+
+        cache.delete(key)
+        assert (get_version() > seen)
+
+        seen = get_version()
+        cache.delete(key)
+        bump_version()
+        assert (get_version() > seen)
@@ -0,0 +1,69 @@
+import pytest
+from django.urls import reverse
+from products.models import *
+from datetime import timedelta
+from django.utils import timezone
+from products.pagination import PAGE_SIZE, keyset_paginate
+from products.test_fixtures import *
+
+@pytest.mark.django_db
+def test_products_view_paginates_with_cursor(client, create_product):
+    products = [create_product(f'Runner {i}') for i in range(PAGE_SIZE + 5)]
+
+    response = client.get(reverse('products'))
+    first_page = list(response.context['products'])
+
+    assert (len(first_page) == PAGE_SIZE)
+    assert (response.context['next_page_url'] != None)
+
+    response = client.get(response.context['next_page_url'])
+    second_page = list(response.context['products'])
+
+    assert (len(second_page) == 5)
+    assert (response.context['next_page_url'] == None)
+    assert (sorted(p.pk for p in first_page + second_page) == sorted(p.pk for p in products))
+
+@pytest.mark.django_db
+def test_products_view_returns_fragment_for_ajax(client, create_product):
+    create_product('Runner')
+
+    response = client.get(reverse('products'), headers = {'X-Requested-With': 'XMLHttpRequest'})
+
+    assert (response.status_code == 200)
+    assert ([t.name for t in response.templates][0] == 'products/products_page.html')
+    assert (b'<html' not in response.content)
+
+@pytest.mark.django_db
+def test_products_view_sorts_by_price(client, create_product):
+    cheap = create_product('Cheap', price = '20.00')
+    expensive = create_product('Expensive', price = '99.00')
+    on_sale = create_product('On sale', price = '200.00', price_on_sale = '5.00')
+
+    response = client.get(reverse('products') + '?sort=price_asc')
+
+    assert ([p.pk for p in response.context['products']] == [on_sale.pk, cheap.pk, expensive.pk])
+
+@pytest.mark.django_db
+def test_products_view_ignores_invalid_cursor(client, create_product):
+    product = create_product('Runner')
+
+    response = client.get(reverse('products') + '?cursor=not-a-cursor')
+
+    assert ([p.pk for p in response.context['products']] == [product.pk])
+
+@pytest.mark.django_db
+def test_keyset_paginate_keeps_sub_millisecond_rows(create_product):
+    products = [create_product(f'Runner {i}') for i in range(30)]
+    start = timezone.now()
+    for i, product in enumerate(products):
+        Product.objects.filter(pk=product.pk).update(created_at=start + timedelta(microseconds=100 * i))
+
+    seen, cursor = [], None
+    while True:
+        page = keyset_paginate(Product.objects.all(), ('-created_at', '-pk'), cursor, page_size=5)
+        seen += [p.pk for p in page.items]
+        if not page.has_next:
+            break
+        cursor = page.next_cursor
+
+    assert (seen == [p.pk for p in reversed(products)])
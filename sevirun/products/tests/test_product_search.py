@@ -0,0 +1,107 @@
+import pytest
+from unittest.mock import patch
+from django.urls import reverse
+from products.models import *
+from products.filters import filter_products
+from products.test_fixtures import *
+from users.test_fixtures import *
+
+def search(text):
+    return list(filter_products({'product-search': text}))
+
+@pytest.mark.django_db
+def test_search_ignores_accents(create_product):
+    product = create_product('Zapatilla Montaña')
+
+    assert (search('montana') == [product])
+
+@pytest.mark.django_db
+def test_search_by_brand_and_description(create_product):
+    product = create_product('Runner', short_description = 'Ideal para trail')
+
+    assert (search('Test Brand') == [product])
+    assert (search('trail') == [product])
+
+@pytest.mark.django_db
+def test_search_ranks_name_matches_first(create_product):
+    in_description = create_product('Runner', short_description = 'Parecida a la Cloud')
+    in_name = create_product('Cloud')
+
+    assert (search('cloud') == [in_name, in_description])
+
+@pytest.mark.django_db
+def test_search_index_follows_edits(create_product, sample_product_attributes):
+    product = create_product('Runner')
+    product.name = 'Sprinter'
+    product.save()
+
+    assert (search('runner') == [])
+    assert (search('sprinter') == [product])
+
+    product_model = sample_product_attributes[0]
+    product_model.name = 'Pegasus'
+    product_model.save()
+
+    assert (search('pegasus') == [product])
+
+@pytest.mark.django_db
+def test_search_index_drops_deleted_products(client, staff_user, create_product):
+    product = create_product('Runner')
+    client.force_login(staff_user)
+
+    client.post(reverse('delete_product', args = [product.pk]))
+
+    assert (search('runner') == [])
+
+@pytest.mark.django_db
+def test_search_with_only_symbols_returns_nothing(create_product):
+    create_product('Runner')
+
+    assert (search('"*') == [])
+
+@pytest.mark.django_db
+def test_search_key_is_normalized(create_product, sample_product_attributes):
+    product = create_product('  Zapatilla   MONTAÑA ')
+
+    assert (product.search_key == 'zapatilla montana')
+    assert (sample_product_attributes[0].search_key == 'model x')
+
+@pytest.mark.django_db
+def test_fuzzy_search_finds_misspelled_names(create_product):
+    product = create_product('Zapatilla Montaña')
+    create_product('Bota Invierno')
+
+    assert (search('zapatila montanna') == [])
+    assert (list(filter_products({'product-search': 'zapatila montanna'}, fuzzy = True)) == [product])
+
+@pytest.mark.django_db
+def test_products_view_suggests_query(client, create_product):
+    product = create_product('Zapatilla Montaña')
+
+    response = client.get(reverse('products') + '?product-search=zapatila')
+
+    assert (response.status_code == 200)
+    assert ([p.pk for p in response.context['products']] == [product.pk])
+    assert (response.context['suggestion'] == 'zapatilla')
+    assert (b'Zapatilla Monta' in response.content)
+
+@pytest.mark.django_db
+def test_search_without_index_sorts_by_relevance(client, create_product):
+    first = create_product('Cloud Runner')
+    second = create_product('Cloud Sprinter')
+
+    with patch('products.search.is_search_index_enabled', return_value = False):
+        response = client.get(reverse('products'), {'product-search': 'cloud'})
+
+    assert (response.status_code == 200)
+    assert ([p.pk for p in response.context['products']] == [first.pk, second.pk])
+
+@pytest.mark.django_db
+def test_search_without_words_or_with_invalid_filters(client, create_product):
+    create_product('Cloud Runner')
+
+    for params in ({'product-search': '***'}, {'size': 'abc', 'product-search': 'foo'}):
+        response = client.get(reverse('products'), params, headers = {'X-Requested-With': 'XMLHttpRequest'})
+
+        assert (response.status_code == 200)
+        assert (list(response.context['products']) == [])
@@ -0,0 +1,108 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from products.models import *
+from products.filters import filter_products
+from products.stock import decrement_stock, get_short_lines
+from types import SimpleNamespace as StockLine
+from products.test_fixtures import *
+from users.test_fixtures import *
+
+@pytest.fixture
+def size_and_colours():
+    size = ProductSize.objects.create(name = '42')
+    red = ProductColour.objects.create(name = 'Red')
+    blue = ProductColour.objects.create(name = 'Blue')
+    return [size, red, blue]
+
+@pytest.mark.django_db
+def test_total_stock_follows_stock_views(client, staff_user, create_product, size_and_colours):
+    [size, red, blue] = size_and_colours
+    product = create_product('Runner')
+    client.force_login(staff_user)
+
+    client.post(reverse('create_stock'), {'product': product.pk, 'size': size.pk, 'colour': red.pk, 'stock': 3})
+    client.post(reverse('create_stock'), {'product': product.pk, 'size': size.pk, 'colour': blue.pk, 'stock': 4})
+    product.refresh_from_db()
+    assert (product.total_stock == 7)
+
+    red_stock = ProductStock.objects.get(product = product, colour = red)
+    client.post(reverse('edit_stock', args = [red_stock.pk]), {'stock': 1})
+    product.refresh_from_db()
+    assert (product.total_stock == 5)
+
+    client.post(reverse('delete_stock', args = [red_stock.pk]))
+    product.refresh_from_db()
+    assert (product.total_stock == 4)
+    assert (product.is_available)
+
+@pytest.mark.django_db
+def test_in_stock_filter(create_product, size_and_colours):
+    [size, red, blue] = size_and_colours
+    in_stock = create_product('Runner')
+    sold_out = create_product('Sprinter')
+    ProductStock.objects.create(product = in_stock, size = size, colour = red, stock = 2)
+    ProductStock.objects.create(product = sold_out, size = size, colour = red, stock = 0)
+
+    assert (list(filter_products({'in_stock': 'on'})) == [in_stock])
+    assert (set(filter_products({})) == {in_stock, sold_out})
+
+@pytest.mark.django_db
+def test_products_list_availability_does_not_query_stock(client, create_product, size_and_colours):
+    [size, red, blue] = size_and_colours
+    for i in range(10):
+        product = create_product(f'Runner {i}')
+        ProductStock.objects.create(product = product, size = size, colour = red, stock = i)
+
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(reverse('products'))
+
+    assert (response.status_code == 200)
+    assert (b'No disponible' in response.content)
+    # Only the filter facet counts read the stock table, never the product cards
+    assert (len([q for q in queries.captured_queries if 'products_productstock' in q['sql']]) <= 1)
+
+@pytest.mark.django_db
+def test_decrement_stock_is_conditional(create_product, size_and_colours):
+    [size, red, blue] = size_and_colours
+    product = create_product('Runner')
+    red_stock = ProductStock.objects.create(product = product, size = size, colour = red, stock = 3)
+    blue_stock = ProductStock.objects.create(product = product, size = size, colour = blue, stock = 1)
+    lines = [
+        StockLine(product_id = product.pk, size_id = size.pk, colour_id = red.pk, quantity = 2),
+        StockLine(product_id = product.pk, size_id = size.pk, colour_id = blue.pk, quantity = 2),
+    ]
+
+    assert (get_short_lines(lines) == [lines[1]])
+    assert (decrement_stock(lines) == [lines[1]])
+
+    red_stock.refresh_from_db()
+    blue_stock.refresh_from_db()
+    product.refresh_from_db()
+    assert (red_stock.stock == 1)
+    assert (blue_stock.stock == 1)
+    assert (product.total_stock == 2)
+    assert (product.card.stock_version == product.stock_version)
+
+    assert (decrement_stock(lines[1:], clamp = True) == [lines[1]])
+    blue_stock.refresh_from_db()
+    assert (blue_stock.stock == 0)
+
+@pytest.mark.django_db
+def test_product_save_keeps_stock_columns(create_product, size_and_colours):
+    [size, red, blue] = size_and_colours
+    product = create_product('Runner')
+    stale = Product.objects.get(pk = product.pk)
+
+    ProductStock.objects.create(product = product, size = size, colour = red, stock = 3)
+    version = Product.objects.get(pk = product.pk).stock_version
+
+    stale.name = 'Sprinter'
+    stale.save()
+
+    product.refresh_from_db()
+    assert (product.name == 'Sprinter')
+    assert (product.total_stock == 3)
+    assert (product.is_available)
+    assert (product.stock_version == version)
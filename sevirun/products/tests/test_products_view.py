@@ -1066,3 +1066,47 @@ def test_products_name_model_search(client):
 
     assert (bytearray(product_1.name, encoding = 'utf-8') in response.content)
     assert (bytearray(product_2.name, encoding = 'utf-8') in response.content)
+
+@pytest.mark.django_db
+def test_products_filters_run_in_one_query(django_assert_num_queries):
+    from products.filters import filter_products
+
+    brand = Brand.objects.create(name = 'Test Brand')
+    product_model = ProductModel.objects.create(name = 'Model X', brand = brand)
+    product_type = ProductType.objects.create(name = 'Shoes')
+    season = ProductSeason.objects.create(name = 'Summer')
+    material = ProductMaterial.objects.create(name = 'Leather')
+    size = ProductSize.objects.create(name = '37')
+    size_2 = ProductSize.objects.create(name = '38')
+    colour = ProductColour.objects.create(name = 'Red')
+
+    for i in range(10):
+        product = Product.objects.create(
+            name = f'Test Product {i}',
+            short_description = 'Short desc',
+            description = 'Long description',
+            picture = 'products/dummy.png',
+            price = '19.99',
+            is_highlighted = False,
+            model = product_model,
+            type = product_type,
+            season = season,
+            material = material,
+        )
+        ProductStock.objects.create(stock = 5, product = product, size = size if i % 2 == 0 else size_2, colour = colour)
+
+    params = {
+        'brand': str(brand.pk),
+        'type': str(product_type.pk),
+        'season': str(season.pk),
+        'material': str(material.pk),
+        'size': str(size.pk),
+        'colour': str(colour.pk),
+        'product-search': 'Test',
+    }
+
+    with django_assert_num_queries(1):
+        products = list(filter_products(params))
+
+    assert (len(products) == 5)
+    assert (all(int(p.name[-1]) % 2 == 0 for p in products))
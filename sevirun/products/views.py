@@ -1,63 +1,50 @@
 from django.shortcuts import render
 from .models import *
-from django.db.models import Sum
 from .models import Product
 from django.contrib.admin.views.decorators import staff_member_required
 from django.shortcuts import redirect, get_object_or_404
 from django.contrib import messages
 from .forms import ProductFiltersForm
+from .filters import filter_products, get_filter_value, SEARCH_PARAM
+from .search import suggest_query
+from .pagination import sort_products, keyset_paginate, is_fragment_request
+from .catalog import get_matching_facet_counts
+from .stock import summarize_stock, with_available_stock
+from .cards import get_product_cards
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+import hashlib
 from django.urls import reverse
 
 def index(request):
-    products = Product.objects.filter(is_deleted=False)
-    
     prev_page = request.GET.get('from', '/')
-    brand_filter = request.GET.get('brand', None)
-    type_filter = request.GET.get('type', None)
-    model_filter = request.GET.get('model', None)
-    season_filter = request.GET.get('season', None)
-    material_filter = request.GET.get('material', None)
-    size_filter = request.GET.get('size', None)
-    colour_filter = request.GET.get('colour', None)
-    search_text = request.GET.get('product-search', None)
-
-    if brand_filter != None and brand_filter != 'null':
-        model_pks = [m.pk for m in ProductModel.objects.all().filter(brand = brand_filter)]
-        products = products.filter(model__in = model_pks)
-
-    if type_filter != None and type_filter != 'null':
-        products = products.filter(type = type_filter)
-
-    if model_filter != None and model_filter != 'null':
-        products = products.filter(model = model_filter)
-
-    if season_filter != None and season_filter != 'null':
-        products = products.filter(season = season_filter)
-
-    if material_filter != None and material_filter != 'null':
-        products = products.filter(material = material_filter)
-
-    if size_filter != None and size_filter != 'null':
-        products_with_size = [s.product.pk for s in ProductStock.objects.all().filter(size = size_filter)]
-        products = products.filter(pk__in = products_with_size)
-
-    if colour_filter != None and colour_filter != 'null':
-        products_with_colour = [s.product.pk for s in ProductStock.objects.all().filter(colour = colour_filter)]
-        products = products.filter(pk__in = products_with_colour)
-
-    if search_text != None and search_text != 'null' and search_text != '':
-        model_pks = [m.pk for m in ProductModel.objects.all().filter(name__contains = search_text)]
-        products_name = products.filter(name__contains = search_text)
-        products_model = products.filter(model__in = model_pks)
-        products = (products_name | products_model).distinct()
-    
-    filters = ProductFiltersForm(request.GET)
+    products = filter_products(request.GET)
+    search_text = get_filter_value(request.GET, SEARCH_PARAM)
+    suggestion = None
+
+    # Typo tolerant fallback when the full-text search finds nothing
+    if search_text != None and not products.exists():
+        products = filter_products(request.GET, fuzzy=True)
+        best_match = products.select_related('model__brand').first()
+
+        if best_match != None:
+            suggestion = suggest_query(search_text, best_match)
+
+    products, ordering = sort_products(products, request.GET.get('sort'), searching=search_text != None)
+    page = keyset_paginate(products.only('pk', 'created_at'), ordering, request.GET.get('cursor'))
 
     context = {
-        'products': products,
-        'filters': filters,
+        'products': get_product_cards(page.items),
+        'next_page_url': page.next_url(request),
+        'search_text': search_text,
+        'suggestion': suggestion,
         'from': prev_page
     }
+
+    if is_fragment_request(request):
+        return render(request, 'products/products_page.html', context)
+
+    context['filters'] = ProductFiltersForm(request.GET, counts=get_matching_facet_counts(products))
     return render(request, 'products/products_list.html', context)
 
 def categories(request):
@@ -81,29 +68,53 @@ def categories(request):
     return render(request, 'products/categories.html', context)
 
 def product_detail(request, product_id):
-    product = get_object_or_404(Product, pk=product_id)
-    
-    sizes = product.productstock_set.values('size__id', 'size__name')\
-        .annotate(total=Sum('stock'))\
-        .order_by('size__name')
+    product = get_object_or_404(
+        Product.objects.select_related('model__brand', 'type', 'season', 'material'),
+        pk=product_id
+    )
 
-    colours = product.productstock_set.values('colour__id', 'colour__name')\
-        .annotate(total=Sum('stock'))\
-        .order_by('colour__name')
+    # Repeat views of an unchanged product (and unchanged stock) get a 304
+    etag = get_product_etag(request, product)
+    has_messages = len(messages.get_messages(request)) > 0
 
-    stock_list = list(product.productstock_set.values('size_id', 'colour_id', 'stock'))
+    if not has_messages:
+        not_modified = get_conditional_response(request, etag=etag, last_modified=int(product.updated_at.timestamp()))
+        if not_modified != None:
+            return set_product_cache_headers(not_modified)
+
+    stocks = list(with_available_stock(product.productstock_set.select_related('size', 'colour')))
+    sizes, colours, stock_list, stock_matrix = summarize_stock(stocks)
 
     context = {
         'product': product,
         'sizes': sizes,
         'colours': colours,
         'stock_list': stock_list,
-        'product_available': product.is_available,
+        'stock_matrix': stock_matrix,
+        'product_available': any(s.available > 0 for s in stocks),
     }
-    return render(request, 'products/product_detail.html', context)
+    response = render(request, 'products/product_detail.html', context)
+
+    if has_messages:
+        return response
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(product.updated_at.timestamp())
+    return set_product_cache_headers(response)
+
+def get_product_etag(request, product):
+    # The page also depends on who is looking at it (navbar, staff actions)
+    user_key = request.user.pk if request.user.is_authenticated else 'anonymous'
+    version = f'{product.pk}:{product.updated_at.timestamp()}:{product.stock_version}:{user_key}'
+    return quote_etag(hashlib.md5(version.encode()).hexdigest())
+
+def set_product_cache_headers(response):
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ['Cookie'])
+    return response
 
 def manage_products(request):
-    products = Product.objects.all()
+    products = get_product_cards(Product.objects.only('pk'))
     context = {
         'products': products,
     }
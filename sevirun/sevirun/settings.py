@@ -149,6 +149,31 @@ if DEBUG:
 else:
     MEDIA_ROOT = os.environ['SEVIRUN_MEDIA_DIR']
 
+# Cache (en producción en disco, para que la compartan todos los workers)
+if DEBUG:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('SEVIRUN_CACHE_DIR', '/var/tmp/sevirun_cache'),
+        }
+    }
+
+# Fragmentos de plantilla (tarjetas de producto): en memoria de cada proceso, acotada y con
+# expulsión LRU. Las claves incluyen la versión del contenido, así que no hay que invalidarlos
+CACHES['fragments'] = {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'fragments',
+    'OPTIONS': {
+        'MAX_ENTRIES': 5000,
+    }
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
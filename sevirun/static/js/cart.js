@@ -1,25 +1,77 @@
 (() => {
-window.updateQuantity = function(itemId, action) {
-    fetch(`/cart/update-ajax/${itemId}/${action}/`)
-        .then(response => response.json())
-        .then(data => {
-            if (data.deleted) {
-                document.getElementById(`item-${itemId}`).remove();
-                document.getElementById("cart-subtotal").innerText = 
-                    data.subtotal.toLocaleString('es-ES', { minimumFractionDigits: 2 }) + "€";
-                
-                if (data.subtotal === 0) {
-                    document.querySelector('.products-section').innerHTML = 
-                        '<div><span>No hay productos en el carrito.</span></div>' +
-                        '<a class="btn btn-primary" style="width: 15%; margin: auto auto 0 auto;" href="/products/">Ver tienda</a>';
-                    document.querySelector('.cart-summary').remove();
-                }
-                return;
-            }
-            document.getElementById(`qty-${itemId}`).innerText = data.quantity;
-            document.getElementById(`subtotal-${itemId}`).innerText =
-                "x" + data.quantity + " = " + data.item_total.toLocaleString('es-ES', { minimumFractionDigits: 2 }) + "€";
-            document.getElementById("cart-subtotal").innerText =
-                data.subtotal.toLocaleString('es-ES', { minimumFractionDigits: 2 }) + "€";
+    // Every +/- click updates the page at once and is queued; after a short pause all queued
+    // operations are sent in a single request, whose cart summary then replaces the page totals
+    const DEBOUNCE_MS = 400;
+    const MAX_QUANTITY = 99;
+    const pending = new Map();
+    let timer = null;
+    let lastRequest = 0;
+
+    const formatPrice = value => value.toLocaleString('es-ES', { minimumFractionDigits: 2 }) + "€";
+
+    window.updateQuantity = function(itemId, action) {
+        if (action === 'delete') {
+            pending.set(itemId, { item: itemId, action: 'delete' });
+            document.getElementById(`item-${itemId}`).remove();
+            flush();
+            return;
+        }
+
+        const display = document.getElementById(`qty-${itemId}`);
+        const current = parseInt(display.innerText, 10);
+        const quantity = action === 'increase' ? Math.min(current + 1, MAX_QUANTITY) : Math.max(current - 1, 1);
+
+        display.innerText = quantity;
+        pending.set(itemId, { item: itemId, quantity: quantity });
+        clearTimeout(timer);
+        timer = setTimeout(flush, DEBOUNCE_MS);
+    };
+
+    function flush() {
+        clearTimeout(timer);
+        if (pending.size === 0) return;
+
+        const operations = Array.from(pending.values());
+        const request = ++lastRequest;
+        pending.clear();
+
+        fetch('/cart/update/', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': document.querySelector('[name=csrfmiddlewaretoken]').value
+            },
+            body: JSON.stringify({ operations: operations })
+        })
+            .then(response => {
+                if (!response.ok) throw new Error(response.statusText);
+                return response.json();
+            })
+            .then(cart => {
+                // Older answers, or answers overtaken by newer clicks, would undo them
+                if (request === lastRequest && pending.size === 0) render(cart);
+            })
+            .catch(() => window.location.reload());
+    }
+
+    function render(cart) {
+        const ids = new Set(cart.items.map(item => `item-${item.id}`));
+        document.querySelectorAll('.product-item').forEach(row => {
+            if (!ids.has(row.id)) row.remove();
         });
-};})()
\ No newline at end of file
+
+        if (cart.items.length === 0) {
+            document.querySelector('.products-section').innerHTML =
+                '<div><span>No hay productos en el carrito.</span></div>' +
+                '<a class="btn btn-primary" style="width: 15%; margin: auto auto 0 auto;" href="/products/">Ver tienda</a>';
+            document.querySelector('.cart-summary').remove();
+            return;
+        }
+
+        cart.items.forEach(item => {
+            document.getElementById(`qty-${item.id}`).innerText = item.quantity;
+            document.getElementById(`subtotal-${item.id}`).innerText = "x" + item.quantity + " = " + formatPrice(item.item_total);
+        });
+        document.getElementById("cart-subtotal").innerText = formatPrice(cart.subtotal);
+    }
+})();
@@ -0,0 +1,31 @@
+(() => {
+    // Loads the next page of cards as an HTML fragment when its "load more" block
+    // gets close to the viewport. Without JavaScript the block is a plain link.
+    const observer = new IntersectionObserver(entries => {
+        entries.forEach(entry => {
+            if (!entry.isIntersecting) return;
+            observer.unobserve(entry.target);
+            loadNextPage(entry.target);
+        });
+    }, { rootMargin: '400px' });
+
+    function loadNextPage(loadMore) {
+        fetch(loadMore.dataset.nextUrl, { headers: { 'X-Requested-With': 'XMLHttpRequest' } })
+            .then(response => {
+                if (!response.ok) throw new Error(response.statusText);
+                return response.text();
+            })
+            .then(html => {
+                const fragment = document.createElement('template');
+                fragment.innerHTML = html;
+                const next = fragment.content.querySelector('.load-more');
+                loadMore.replaceWith(fragment.content);
+                if (next) observer.observe(next);
+            })
+            .catch(() => {
+                // Leave the link in place so the user can still load the page by hand
+            });
+    }
+
+    document.querySelectorAll('.load-more').forEach(loadMore => observer.observe(loadMore));
+})();
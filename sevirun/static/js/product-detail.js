@@ -4,21 +4,22 @@
     document.addEventListener('DOMContentLoaded', function () {
         const stockScript = document.getElementById('product-stock-data');
         const availScript = document.getElementById('product-available');
-        let stockList = [];
+        let stockMatrix = { sizes: [], colours: [], stock: [] };
         let productAvailable = true;
 
         if (stockScript) {
-            try { stockList = JSON.parse(stockScript.textContent || '[]'); } catch (e) { stockList = []; }
+            try { stockMatrix = JSON.parse(stockScript.textContent || '{}'); } catch (e) { stockMatrix = { sizes: [], colours: [], stock: [] }; }
         }
         if (availScript) {
             try { productAvailable = JSON.parse(availScript.textContent); } catch (e) { productAvailable = true; }
         }
 
-        // Build dict: sizeid_colourid -> stock
+        // Build dict: sizeid_colourid -> stock from the size x colour matrix
         const stockMap = {};
-        stockList.forEach(function (it) {
-            const key = (it.size_id || '') + '_' + (it.colour_id || '');
-            stockMap[key] = (it.stock || 0);
+        (stockMatrix.sizes || []).forEach(function (sizeId, i) {
+            (stockMatrix.colours || []).forEach(function (colourId, j) {
+                stockMap[sizeId + '_' + colourId] = (stockMatrix.stock[i][j] || 0);
+            });
         });
 
         const sizeSelect = qs('size-select');
@@ -113,6 +114,20 @@
             return;
         }
 
-        window.location.href = `/cart/add/${productId}/${colorId}/${sizeId}/${quantity}`;
+        const url = `/cart/add/${productId}/${colorId}/${sizeId}/${quantity}`;
+        const feedback = document.getElementById('cart-feedback');
+
+        fetch(url, { headers: { 'X-Requested-With': 'XMLHttpRequest' } })
+            .then(response => {
+                if (!response.ok) throw new Error(response.statusText);
+                return response.json();
+            })
+            .then(data => {
+                feedback.classList.toggle('text-danger', !data.added);
+                feedback.classList.toggle('text-success', data.added && !data.message);
+                feedback.innerHTML = data.message || `Añadido al carrito (${data.quantity} en total). `;
+                if (data.added) feedback.innerHTML += ' <a href="/cart/">Ver carrito</a>';
+            })
+            .catch(() => { window.location.href = url; });
     };
 })();